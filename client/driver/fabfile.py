@@ -157,7 +157,7 @@ def upload_result():
 
 @task
 def get_result():
-    cmd = 'python3 ../../script/query_and_get.py {} {} 5'.\
+    cmd = 'python3 ../../script/query_and_get.py {} {} 60'.\
           format(CONF['upload_url'], CONF['upload_code'])
     local(cmd)
 
@@ -7,6 +7,8 @@ import argparse
 import glob
 import logging
 import os
+import tempfile
+import zipfile
 import requests
 
 
@@ -47,16 +49,54 @@ def upload_batch(datadir, upload_code, url):
         LOG.info(response.content)
 
 
+# Upload all samples in the datadir at once as a zip archive. The url is
+# server_ip/new_results_batch/. If recommend is True and the session is a
+# tuning session, a configuration is recommended for the latest sample.
+def upload_archive(datadir, upload_code, url, recommend=False):
+
+    samples = glob.glob(os.path.join(datadir, '*__summary.json'))
+    LOG.info('Uploading %d samples in %s as a single archive...', len(samples), datadir)
+
+    archive_file = tempfile.TemporaryFile()
+    with zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for sample in samples:
+            prefix = sample.split('/')[-1].split('__')[0]
+            for name in ('summary', 'knobs', 'metrics_before', 'metrics_after'):
+                filename = '{}__{}.json'.format(prefix, name)
+                archive.write(os.path.join(datadir, filename), filename)
+    archive_file.seek(0)
+
+    data = {'upload_code': upload_code}
+    if recommend:
+        data['recommend'] = 'on'
+    response = requests.post(url,
+                             files={'archive': archive_file},
+                             data=data)
+    archive_file.close()
+    LOG.info(response.content)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Upload generated data to the website")
     parser.add_argument('datadir', type=str, nargs=1,
                         help='Directory containing the generated data')
     parser.add_argument('upload_code', type=str, nargs=1,
                         help='The website\'s upload code')
-    parser.add_argument('url', type=str, default='http://0.0.0.0:8000/new_result/',
-                        nargs='?', help='The upload url: server_ip/new_result/')
+    parser.add_argument('url', type=str, default=None,
+                        nargs='?', help='The upload url: server_ip/new_result/ '
+                        '(or server_ip/new_results_batch/ with --archive)')
+    parser.add_argument('--archive', action='store_true',
+                        help='Upload all samples in a single request')
+    parser.add_argument('--recommend', action='store_true',
+                        help='Recommend a configuration for the latest sample '
+                        '(with --archive)')
     args = parser.parse_args()
-    upload_batch(args.datadir[0], args.upload_code[0], args.url)
+    if args.archive:
+        url = args.url or 'http://0.0.0.0:8000/new_results_batch/'
+        upload_archive(args.datadir[0], args.upload_code[0], url, args.recommend)
+    else:
+        url = args.url or 'http://0.0.0.0:8000/new_result/'
+        upload_batch(args.datadir[0], args.upload_code[0], url)
 
 
 if __name__ == "__main__":
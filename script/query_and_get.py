@@ -13,6 +13,7 @@ import sys
 import time
 import logging
 import json
+import urllib.parse
 import urllib.request
 
 # Logging
@@ -24,23 +25,28 @@ LOG.setLevel(logging.INFO)
 # take 3 arguments, save result to next_config in working directory
 # base_url: for instance, https://0.0.0.0:8000/
 # upload_code: upload code...
-# query_interval: time (in second) between queries
+# query_interval: time (in second) each query waits on the server for the
+#                 result to be ready (the server caps it)
 def main():
     base_url = sys.argv[1].strip('/')
     upload_code = sys.argv[2]
     query_interval = int(sys.argv[3])
-    request = base_url + '/query_and_get/' + upload_code
-    timer = 0
+    request = base_url + '/query_and_get/' + upload_code + \
+        '?' + urllib.parse.urlencode({'wait': query_interval})
     start = time.time()
     while True:
+        # The server holds the request until the result is ready (or the
+        # wait expires) so the next query can be sent right away
+        query_start = time.time()
         response = urllib.request.urlopen(request).read().decode()
         if 'Fail' in response:
             LOG.info('Tuning failed\n')
             break
         elif response == 'null' or 'not ready' in response:
-            time.sleep(query_interval)
-            timer += query_interval
-            LOG.info('%s s\n', str(timer))
+            # Wait for the rest of the interval if the server answered early
+            # (e.g., the result has no tasks yet)
+            time.sleep(max(0, query_interval - (time.time() - query_start)))
+            LOG.info('%s s\n', str(int(time.time() - start)))
         else:
             next_conf_f = open('next_config', 'w')
             next_conf_f.write(json.loads(response))
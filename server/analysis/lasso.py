@@ -10,6 +10,7 @@ Created on Jul 8, 2016
 '''
 
 import numpy as np
+from sklearn.externals.joblib import Parallel, delayed
 from sklearn.linear_model import lasso_path
 
 from .base import ModelBase
@@ -38,6 +39,10 @@ class LassoPath(ModelBase):
     coefs_ : array, [n_outputs, n_features, n_alphas]
              Coefficients along the path.
 
+             If the paths were computed separately for each target (i.e.,
+             n_jobs != 1) then alphas_ and coefs_ are lists with one entry
+             per target of shape [n_alphas] and [n_features, n_alphas].
+
     rankings_ : array, [n_features]
              The average ranking of each feature across all target values.
     """
@@ -54,7 +59,8 @@ class LassoPath(ModelBase):
         self.coefs_ = None
         self.rankings_ = None
 
-    def fit(self, X, y, feature_labels, estimator_params=None):
+    def fit(self, X, y, feature_labels, estimator_params=None, max_features=None,
+            n_jobs=1):
         """Computes the Lasso path using Sklearn's lasso_path method.
 
         Parameters
@@ -71,6 +77,22 @@ class LassoPath(ModelBase):
         estimator_params : dict, optional
                            The parameters to pass to Sklearn's Lasso estimator.
 
+        max_features : int, optional
+                       If provided, the path is computed in chunks of alphas
+                       and stops as soon as at least max_features features
+                       have entered the regression. Features that have not
+                       entered by then are tied for the last rank. If the
+                       paths are computed separately for each target, they
+                       are all cut off at the longest of them.
+
+        n_jobs : int, optional
+                 If not 1, a separate (single-target) Lasso path is computed
+                 for each output in y using n_jobs processes (-1 uses all
+                 CPUs), and the features are ranked by their average
+                 entrance step across these paths. Note that these paths are
+                 independent, unlike the multi-task path computed when all
+                 outputs are fit together.
+
 
         Returns
         -------
@@ -81,24 +103,32 @@ class LassoPath(ModelBase):
             estimator_params = {}
         self.feature_labels_ = feature_labels
 
-        alphas, coefs, _ = lasso_path(X, y, **estimator_params)
-        self.alphas_ = alphas.copy()
-        self.coefs_ = coefs.copy()
+        if n_jobs == 1 or y.ndim == 1 or y.shape[1] == 1:
+            alphas, coefs = compute_lasso_path(X, y, estimator_params, max_features)
+            self.alphas_ = alphas
+            self.coefs_ = coefs
+            entrance_steps = get_entrance_steps(coefs)
+        else:
+            paths = Parallel(n_jobs=n_jobs)(
+                delayed(compute_lasso_path)(X, y[:, i], estimator_params, max_features)
+                for i in range(y.shape[1]))
+            if max_features is not None:
+                # Each path stops at a different step. The shorter ones are
+                # extended to the longest one so that the features that have
+                # not entered the paths have the same entrance step in each.
+                n_alphas = max(len(alphas) for alphas, _ in paths)
+                paths = Parallel(n_jobs=n_jobs)(
+                    delayed(extend_lasso_path)(X, y[:, i], alphas, coefs, n_alphas,
+                                               estimator_params)
+                    for i, (alphas, coefs) in enumerate(paths))
+            self.alphas_ = [alphas for alphas, _ in paths]
+            self.coefs_ = [coefs[0] for _, coefs in paths]
+            entrance_steps = np.vstack([get_entrance_steps(coefs) for _, coefs in paths])
 
         # Rank the features in X by order of importance. This ranking is based
         # on how early a given features enter the regression (the earlier a
         # feature enters the regression, the MORE important it is).
-        feature_rankings = [[] for _ in range(X.shape[1])]
-        for target_coef_paths in self.coefs_:
-            for i, feature_path in enumerate(target_coef_paths):
-                entrance_step = 1
-                for val_at_step in feature_path:
-                    if val_at_step == 0:
-                        entrance_step += 1
-                    else:
-                        break
-                feature_rankings[i].append(entrance_step)
-        self.rankings_ = np.array([np.mean(ranks) for ranks in feature_rankings])
+        self.rankings_ = np.mean(entrance_steps, axis=0)
         return self
 
     def get_ranked_features(self):
@@ -107,3 +137,106 @@ class LassoPath(ModelBase):
 
         rank_idxs = np.argsort(self.rankings_)
         return [self.feature_labels_[i] for i in rank_idxs]
+
+
+def compute_lasso_path(X, y, estimator_params=None, max_features=None,
+                       alphas_per_step=10):
+    """Computes the Lasso path of y on X.
+
+    If max_features is provided, the path is computed alphas_per_step alphas
+    at a time (warm-starting each step from the coefficients at the smallest
+    alpha of the previous one) and stops once at least max_features features
+    have entered it.
+
+    Returns the alphas along the path and the coefficients as an array of
+    shape [n_outputs, n_features, n_alphas] (n_outputs is 1 if y is 1D).
+    """
+    estimator_params = dict(estimator_params or {})
+    if max_features is None:
+        alphas, coefs, _ = lasso_path(X, y, **estimator_params)
+    else:
+        alphas, estimator_params = get_path_alphas(X, y, estimator_params)
+        alpha_steps = []
+        coef_steps = []
+        coef_init = None
+        entered = np.zeros(X.shape[1], dtype=bool)
+        for start in range(0, len(alphas), alphas_per_step):
+            step_alphas, step_coefs, _ = lasso_path(
+                X, y, alphas=alphas[start:start + alphas_per_step],
+                coef_init=coef_init, **estimator_params)
+            alpha_steps.append(step_alphas)
+            coef_steps.append(step_coefs)
+            coef_init = step_coefs[..., -1].copy()
+            step_nonzero = step_coefs.reshape(-1, X.shape[1], len(step_alphas)) != 0
+            entered |= np.any(step_nonzero, axis=(0, 2))
+            if np.count_nonzero(entered) >= max_features:
+                break
+        alphas = np.concatenate(alpha_steps)
+        coefs = np.concatenate(coef_steps, axis=-1)
+
+    if coefs.ndim == 2:
+        # Single output
+        coefs = coefs[np.newaxis, :, :]
+    return alphas.copy(), coefs.copy()
+
+
+def extend_lasso_path(X, y, alphas, coefs, n_alphas, estimator_params=None):
+    """Extends a Lasso path of y on X that was cut off early (see
+    compute_lasso_path) to its first n_alphas alphas, warm-starting from the
+    coefficients at its smallest alpha.
+
+    Returns the alphas and the coefficients of the extended path.
+    """
+    if len(alphas) >= n_alphas:
+        return alphas, coefs
+    path_alphas, estimator_params = get_path_alphas(X, y, estimator_params or {})
+    ext_alphas, ext_coefs, _ = lasso_path(
+        X, y, alphas=path_alphas[len(alphas):n_alphas],
+        coef_init=coefs[0, :, -1].copy(), **estimator_params)
+    if ext_coefs.ndim == 2:
+        # Single output
+        ext_coefs = ext_coefs[np.newaxis, :, :]
+    return np.concatenate([alphas, ext_alphas]), np.concatenate([coefs, ext_coefs], axis=-1)
+
+
+def get_path_alphas(X, y, estimator_params):
+    """Returns the (decreasing) alphas along the Lasso path of y on X, given
+    by estimator_params or else by the grid used by Sklearn's lasso_path,
+    and the remaining estimator parameters."""
+    estimator_params = dict(estimator_params)
+    alphas = estimator_params.pop('alphas', None)
+    eps = estimator_params.pop('eps', 1e-3)
+    n_alphas = estimator_params.pop('n_alphas', 100)
+    estimator_params.pop('coef_init', None)
+    if alphas is None:
+        alphas = get_alpha_grid(X, y, eps=eps, n_alphas=n_alphas)
+    else:
+        alphas = np.sort(alphas)[::-1]
+    return alphas, estimator_params
+
+
+def get_alpha_grid(X, y, eps=1e-3, n_alphas=100):
+    """Returns the (decreasing) grid of alphas used by Sklearn's lasso_path
+    when no alphas are given."""
+    n_samples = X.shape[0]
+    Xy = np.dot(X.T, y)
+    if Xy.ndim == 1:
+        Xy = Xy[:, np.newaxis]
+    alpha_max = np.sqrt(np.sum(Xy ** 2, axis=1)).max() / n_samples
+    if alpha_max <= np.finfo(float).resolution:
+        return np.full(n_alphas, np.finfo(float).resolution)
+    return np.logspace(np.log10(alpha_max * eps), np.log10(alpha_max),
+                       num=n_alphas)[::-1]
+
+
+def get_entrance_steps(coefs):
+    """Returns the (1-based) step at which each feature first has a non-zero
+    coefficient along each target's path. Features that never enter the
+    regression are assigned n_alphas + 1.
+
+    coefs : array, [n_outputs, n_features, n_alphas]
+    """
+    nonzero = coefs != 0
+    entrance_steps = np.argmax(nonzero, axis=-1) + 1
+    entrance_steps[~np.any(nonzero, axis=-1)] = coefs.shape[-1] + 1
+    return entrance_steps
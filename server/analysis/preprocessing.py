@@ -48,35 +48,16 @@ class Bin(Preprocess):
         self.axis_ = axis
 
     def fit(self, matrix):
-        if self.axis_ is None:
-            self.deciles_ = get_deciles(matrix, self.axis_)
-        elif self.axis_ == 0:  # Bin columns
-            self.deciles_ = []
-            for col in matrix.T:
-                self.deciles_.append(get_deciles(col, axis=None))
-        elif self.axis_ == 1:  # Bin rows
-            self.deciles_ = []
-            for row in matrix:
-                self.deciles_.append(get_deciles(row, axis=None))
+        # The deciles of every column (axis=0) or row (axis=1) are computed
+        # with a single call to np.percentile. deciles_ has shape
+        # (10, n_columns) or (10, n_rows), respectively.
+        self.deciles_ = get_deciles(matrix, self.axis_)
         return self
 
     def transform(self, matrix, copy=True):
         assert self.deciles_ is not None
-        if self.axis_ is None:
-            res = bin_by_decile(matrix, self.deciles_,
-                                self.bin_start_, self.axis_)
-        elif self.axis_ == 0:  # Transform columns
-            columns = []
-            for col, decile in zip(matrix.T, self.deciles_):
-                columns.append(bin_by_decile(col, decile,
-                                             self.bin_start_, axis=None))
-            res = np.vstack(columns).T
-        elif self.axis_ == 1:  # Transform rows
-            rows = []
-            for row, decile in zip(matrix, self.deciles_):
-                rows.append(bin_by_decile(row, decile,
-                                          self.bin_start_, axis=None))
-            res = np.vstack(rows)
+        res = bin_by_decile(matrix, self.deciles_,
+                            self.bin_start_, self.axis_)
         assert res.shape == matrix.shape
         return res
 
@@ -85,32 +66,62 @@ class Bin(Preprocess):
 
 
 def get_deciles(matrix, axis=None):
-    if axis is not None:
-        raise NotImplementedError("Axis is not yet implemented")
+    if axis is not None and axis != 0 and axis != 1:
+        raise NotImplementedError("Axis={} is not yet implemented".format(axis))
 
     assert matrix.ndim > 0
     assert matrix.size > 0
 
     decile_range = np.arange(10, 101, 10)
     deciles = np.percentile(matrix, decile_range, axis=axis)
-    deciles[-1] = np.Inf
+    deciles[-1] = np.inf
     return deciles
 
 
 def bin_by_decile(matrix, deciles, bin_start, axis=None):
-    if axis is not None:
-        raise NotImplementedError("Axis is not yet implemented")
+    if axis is not None and axis != 0 and axis != 1:
+        raise NotImplementedError("Axis={} is not yet implemented".format(axis))
 
     assert matrix.ndim > 0
     assert matrix.size > 0
     assert deciles is not None
     assert len(deciles) == 10
 
-    binned_matrix = np.zeros_like(matrix)
-    for i in range(10)[::-1]:
-        decile = deciles[i]
-        binned_matrix[matrix <= decile] = i + bin_start
-
+    # Each value is assigned to the first decile that is >= the value, i.e.,
+    # its bin is the number of deciles that are strictly smaller than it
+    # (a searchsorted with side='left'). The last decile is infinite.
+    deciles = np.asarray(deciles)
+    bounds = deciles[:-1]
+    if np.any(np.isnan(bounds)):
+        # No value is <= a NaN decile so NaN deciles are skipped: they are
+        # replaced by the previous decile (-inf for the first ones). E.g., the
+        # values of a column whose deciles are NaN fall into the last bin.
+        bounds = np.maximum.accumulate(np.where(np.isnan(bounds), -np.inf, bounds), axis=0)
+    binned_matrix = np.empty_like(matrix)
+    if axis is None or bounds.ndim == 1:
+        binned_matrix[...] = np.searchsorted(bounds, matrix, side='left')
+    else:
+        # The deciles of each column (axis=0) or row (axis=1) are searched at
+        # once by offsetting them (and the values) so that the deciles of
+        # different columns/rows do not overlap. The values are first replaced
+        # by their (integer) rank among all the deciles so that the offsets
+        # do not change how they compare to the deciles.
+        values = matrix if axis == 0 else matrix.T
+        output = binned_matrix if axis == 0 else binned_matrix.T
+        num_bounds, num_columns = bounds.shape
+        sorted_bounds = np.sort(bounds, axis=None)
+        offsets = np.arange(num_columns) * (sorted_bounds.size + 1)
+        bound_keys = np.searchsorted(sorted_bounds, bounds.T, side='left') + offsets[:, np.newaxis]
+        value_keys = np.searchsorted(sorted_bounds, values, side='left') + offsets
+        output[...] = np.searchsorted(bound_keys.ravel(), value_keys, side='left') - \
+            np.arange(num_columns) * num_bounds
+    binned_matrix += bin_start
+
+    # Values that do not fall into any bin (e.g., NaNs) are set to zero
+    last_decile = deciles[-1]
+    if axis is not None and last_decile.ndim > 0:
+        last_decile = np.expand_dims(last_decile, axis=axis)
+    binned_matrix[~(matrix <= last_decile)] = 0
     return binned_matrix
 
 
@@ -177,6 +188,45 @@ def get_shuffle_indices(size, seed=None):
         return indices
 
 
+# ==========================================================
+#   Constant Columns & Duplicate Rows
+# ==========================================================
+def get_nonconstant_columns(matrix):
+    """Returns a boolean mask that is True for each column in the matrix
+    that contains at least two distinct values."""
+    assert matrix.ndim == 2
+    if matrix.shape[0] == 0:
+        return np.zeros(matrix.shape[1], dtype=bool)
+    return np.any(matrix != matrix[0], axis=0)
+
+
+def get_row_views(matrix, dtype=None):
+    """Returns a 1D view of the matrix where each row is a single opaque
+    (np.void) element, so that whole rows can be compared, sorted and
+    searched in one vectorized operation."""
+    assert matrix.ndim == 2
+    if dtype is None:
+        dtype = matrix.dtype
+    matrix = np.ascontiguousarray(matrix, dtype=dtype)
+    if matrix.dtype.kind == 'f':
+        # Normalize negative zeros so that 0.0 and -0.0 compare equal
+        matrix = matrix + 0.0
+    row_dtype = np.dtype((np.void, matrix.dtype.itemsize * matrix.shape[1]))
+    return matrix.view(row_dtype).ravel()
+
+
+def get_rows_in(matrix, other_matrix):
+    """Returns a boolean mask that is True for each row in the matrix that
+    also appears in other_matrix."""
+    assert matrix.ndim == 2 and other_matrix.ndim == 2
+    assert matrix.shape[1] == other_matrix.shape[1]
+    if matrix.shape[0] == 0 or other_matrix.shape[0] == 0:
+        return np.zeros(matrix.shape[0], dtype=bool)
+    dtype = np.result_type(matrix, other_matrix)
+    return np.isin(get_row_views(matrix, dtype),
+                   get_row_views(other_matrix, dtype))
+
+
 # ==========================================================
 #   Polynomial Features
 # ==========================================================
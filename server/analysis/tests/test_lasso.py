@@ -0,0 +1,67 @@
+#
+# OtterTune - test_lasso.py
+#
+# Copyright (c) 2017-18, Carnegie Mellon University Database Group
+#
+import unittest
+import numpy as np
+
+from analysis.lasso import LassoPath, get_entrance_steps
+
+
+class TestLassoPath(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestLassoPath, cls).setUpClass()
+        rng = np.random.RandomState(42)
+        cls.X = rng.randn(80, 20)
+        weights = np.zeros((20, 2))
+        weights[[4, 9, 13], :] = [[6.0, 5.0], [3.0, 2.5], [1.0, 1.0]]
+        cls.y = np.dot(cls.X, weights) + 0.01 * rng.randn(80, 2)
+        cls.labels = ['knob_{}'.format(i) for i in range(20)]
+
+    def test_entrance_steps(self):
+        coefs = np.array([[[0, 0, 1, 2],
+                           [3, 4, 5, 6],
+                           [0, 0, 0, 0],
+                           [0, 1, 0, 0]]], dtype=float)
+        steps = get_entrance_steps(coefs)
+        self.assertEqual(steps.tolist(), [[3, 1, 5, 2]])
+
+    def test_ranked_features(self):
+        model = LassoPath().fit(self.X, self.y, self.labels)
+        self.assertEqual(model.get_ranked_features()[:3],
+                         ['knob_4', 'knob_9', 'knob_13'])
+
+    def test_truncated_path(self):
+        full_model = LassoPath().fit(self.X, self.y, self.labels)
+        model = LassoPath().fit(self.X, self.y, self.labels, max_features=3)
+        self.assertLess(model.coefs_.shape[-1], full_model.coefs_.shape[-1])
+        self.assertEqual(model.get_ranked_features()[:3],
+                         full_model.get_ranked_features()[:3])
+
+    def test_parallel_paths(self):
+        model = LassoPath().fit(self.X, self.y, self.labels, n_jobs=2)
+        self.assertEqual(len(model.coefs_), self.y.shape[1])
+        self.assertEqual(model.coefs_[0].shape[0], self.X.shape[1])
+        self.assertEqual(model.get_ranked_features()[:3],
+                         ['knob_4', 'knob_9', 'knob_13'])
+
+    def test_truncated_parallel_paths(self):
+        # Fewer features enter the path of the second target early on, so
+        # its path is longer than the path of the first one
+        weights = np.zeros((20, 2))
+        weights[[4, 9, 13], :] = [[6.0, 5.0], [3.0, 0.2], [1.0, 0.1]]
+        y = np.dot(self.X, weights)
+        model = LassoPath().fit(self.X, y, self.labels, max_features=3)
+        parallel_model = LassoPath().fit(self.X, y, self.labels, max_features=3, n_jobs=2)
+
+        # The paths of all the targets are cut off at the same step
+        self.assertEqual(len(parallel_model.alphas_[0]), len(parallel_model.alphas_[1]))
+        self.assertEqual(parallel_model.get_ranked_features()[:3],
+                         model.get_ranked_features()[:3])
+
+
+if __name__ == '__main__':
+    unittest.main()
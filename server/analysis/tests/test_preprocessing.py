@@ -6,7 +6,9 @@
 import unittest
 import numpy as np
 
-from analysis.preprocessing import DummyEncoder, consolidate_columnlabels
+from analysis.preprocessing import (Bin, DummyEncoder, bin_by_decile,
+                                    consolidate_columnlabels, get_deciles,
+                                    get_nonconstant_columns, get_rows_in)
 
 
 class TestDummyEncoder(unittest.TestCase):
@@ -79,5 +81,57 @@ class TestDummyEncoder(unittest.TestCase):
         self.assertTrue(np.all(X == X_decoded))
 
 
+class TestBin(unittest.TestCase):
+
+    def test_bin_columns(self):
+        X = np.array([np.arange(20), np.arange(20)[::-1] * 3.5, np.ones(20)]).T
+        binner = Bin(bin_start=1, axis=0)
+        X_binned = binner.fit_transform(X)
+        self.assertEqual(binner.deciles_.shape, (10, 3))
+        for j in range(X.shape[1]):
+            col_deciles = get_deciles(X[:, j])
+            expected = bin_by_decile(X[:, j], col_deciles, bin_start=1)
+            self.assertTrue(np.array_equal(X_binned[:, j], expected))
+
+    def test_bin_rows(self):
+        X = np.array([np.arange(20), np.arange(20)[::-1] * 3.5, np.ones(20)])
+        binner = Bin(bin_start=0, axis=1)
+        X_binned = binner.fit_transform(X)
+        self.assertEqual(binner.deciles_.shape, (10, 3))
+        for i in range(X.shape[0]):
+            row_deciles = get_deciles(X[i])
+            expected = bin_by_decile(X[i], row_deciles, bin_start=0)
+            self.assertTrue(np.array_equal(X_binned[i], expected))
+
+    def test_bin_by_decile(self):
+        X = np.arange(1, 11, dtype=float)
+        deciles = get_deciles(X)
+        X_binned = bin_by_decile(X, deciles, bin_start=1)
+        self.assertTrue(np.array_equal(X_binned, np.arange(1, 11)))
+
+    def test_nan_deciles(self):
+        # The deciles of a column with a NaN are NaN (except the last one), so
+        # its other values fall into the last bin
+        X = np.array([np.arange(10, dtype=float), np.append(np.arange(9.0), np.nan)]).T
+        X_binned = Bin(bin_start=1, axis=0).fit_transform(X)
+        self.assertTrue(np.array_equal(X_binned[:, 0], np.arange(1, 11)))
+        self.assertEqual(X_binned[:, 1].tolist(), [10] * 9 + [0])
+
+
+class TestFilters(unittest.TestCase):
+
+    def test_nonconstant_columns(self):
+        X = np.array([[1, 2, 3, 0], [1, 5, 3, 0], [1, 2, 4, 0]])
+        mask = get_nonconstant_columns(X)
+        self.assertEqual(mask.tolist(), [False, True, True, False])
+
+    def test_rows_in(self):
+        X = np.array([[0.5, 1.0], [2.0, 3.0], [-0.0, 1.0], [2.0, 3.0]])
+        other = np.array([[2.0, 3.0], [0.0, 1.0], [7.0, 7.0]])
+        mask = get_rows_in(X, other)
+        self.assertEqual(mask.tolist(), [False, True, True, True])
+        self.assertEqual(get_rows_in(X, other[:0]).tolist(), [False] * 4)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -15,6 +15,8 @@ from fabric.api import env, local, quiet, settings, task
 from fabric.state import output as fabric_output
 
 from website.settings import DATABASES, PROJECT_ROOT
+from website.settings import (CELERY_BACKGROUND_QUEUE, CELERY_DEFAULT_QUEUE,
+                              CELERY_TUNER_QUEUE)
 
 LOG = logging.getLogger(__name__)
 
@@ -65,7 +67,15 @@ def status_rabbitmq():
 def start_celery():
     if status_rabbitmq() == STATUS.STOPPED:
         start_rabbitmq()
-    local('python manage.py celery worker --detach --loglevel=info --pool=threads')
+    # The recommendation tasks and the background pipeline tasks are run by
+    # separate workers so they do not compete for the same processes
+    cmd = ('python manage.py celery worker --detach --loglevel=info --pool=threads '
+           '--queues={queues} --hostname={name}@%h --pidfile=celery_{name}.pid '
+           '--logfile=celery_{name}.log {options}').format
+    local(cmd(queues=','.join([CELERY_DEFAULT_QUEUE, CELERY_TUNER_QUEUE]),
+              name=CELERY_TUNER_QUEUE, options=''))
+    local(cmd(queues=CELERY_BACKGROUND_QUEUE, name=CELERY_BACKGROUND_QUEUE,
+              options='--concurrency=1'))
 
 
 @task
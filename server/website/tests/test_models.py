@@ -0,0 +1,87 @@
+#
+# OtterTune - test_models.py
+#
+# Copyright (c) 2017-18, Carnegie Mellon University Database Group
+#
+
+import zlib
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+
+from website.models import BackupData, PipelineData, PipelineRun, Result
+
+
+class CompositeIndexTests(TestCase):
+
+    fixtures = ['test_website.json']
+
+    @staticmethod
+    def get_index_names(model):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table)
+        return {name: info['columns'] for name, info in constraints.items() if info['index']}
+
+    def get_indexes(self, model):
+        return list(self.get_index_names(model).values())
+
+    def assertUsesIndex(self, queryset, columns):  # pylint: disable=invalid-name
+        # Checks that the query plan reads the table of the queryset with the
+        # index on the given columns
+        if connection.vendor != 'mysql':
+            self.skipTest('The query plans are only checked with MySQL')
+        model = queryset.model
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            fields = [col[0] for col in cursor.description]
+            plan = [dict(zip(fields, row)) for row in cursor.fetchall()]
+        keys = [step['key'] for step in plan if step['table'] == model._meta.db_table]
+        index_names = [name for name, index_columns in self.get_index_names(model).items()
+                       if index_columns == columns]
+        self.assertEqual(len(keys), 1)
+        self.assertIn(keys[0], index_names)
+
+    def test_result_indexes(self):
+        indexes = self.get_indexes(Result)
+        self.assertIn(['session_id', 'dbms_id', 'workload_id'], indexes)
+        self.assertIn(['session_id', 'workload_id', 'knob_data_id', 'observation_end_time'],
+                      indexes)
+
+    def test_pipeline_data_indexes(self):
+        indexes = self.get_indexes(PipelineData)
+        self.assertIn(['pipeline_run_id', 'workload_id'], indexes)
+
+    def test_hot_query_plans(self):
+        result = Result.objects.select_related('workload').first()
+        self.assertUsesIndex(
+            Result.objects.filter(session=result.session_id, dbms=result.dbms_id,
+                                  workload=result.workload_id),
+            ['session_id', 'dbms_id', 'workload_id'])
+        self.assertUsesIndex(
+            Result.objects.filter(
+                session=result.session_id, knob_data=result.knob_data_id,
+                workload=result.workload_id).order_by('-observation_end_time')[:1],
+            ['session_id', 'workload_id', 'knob_data_id', 'observation_end_time'])
+
+        pipeline_run = PipelineRun.objects.get_latest()
+        if pipeline_run is None:
+            self.skipTest('There are no pipeline runs')
+        self.assertUsesIndex(
+            PipelineData.objects.filter(
+                pipeline_run=pipeline_run,
+                workload__dbms=result.workload.dbms_id,
+                workload__hardware=result.workload.hardware_id),
+            ['pipeline_run_id', 'workload_id'])
+
+
+class BackupDataTests(TestCase):
+
+    def test_compress_file(self):
+        uploaded_file = SimpleUploadedFile('knobs.json', b'{"global": {}}')
+        data = BackupData.objects.compress_file(uploaded_file)
+        self.assertEqual(zlib.decompress(data), b'{"global": {}}')
+        # The file can still be parsed after it is compressed
+        self.assertEqual(uploaded_file.read(), b'{"global": {}}')
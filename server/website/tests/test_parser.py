@@ -4,12 +4,16 @@
 # Copyright (c) 2017-18, Carnegie Mellon University Database Group
 #
 
+import time
 from abc import ABCMeta, abstractmethod
 import mock
+from django.db.models import F
 from django.test import TestCase
+from website.parser import Parser
 from website.parser.postgres import PostgresParser, Postgres96Parser
-from website.types import BooleanType, VarType, KnobUnitType, MetricType
-from website.models import KnobCatalog
+from website.types import BooleanType, DBMSType, VarType, KnobUnitType, MetricType
+from website.models import CacheVersion, DBMSCatalog, KnobCatalog
+from website.settings import CACHE_VERSION_CHECK_INTERVAL
 
 
 class BaseParserTests(object, metaclass=ABCMeta):
@@ -103,6 +107,12 @@ class BaseParserTests(object, metaclass=ABCMeta):
         self.assertEqual(len(list(test_parse.keys())), 1)
         self.assertEqual(test_parse.get('local.FAKE_KNOB'), ['FAKE'])
 
+    def test_sum_metric_values(self):
+        self.assertEqual(self.test_dbms.sum_metric_values(['1', '2', '3']), 6)
+        # The sums of large counters do not overflow
+        self.assertEqual(self.test_dbms.sum_metric_values([str(2 ** 62)] * 2), 2 ** 63)
+        self.assertEqual(self.test_dbms.sum_metric_values([str(2 ** 64), '-1']), 2 ** 64 - 1)
+
     def test_parse_dbms_variables(self):
         test_dbms_vars = {'global': {'GlobalView1':
                                      {'cpu_tuple_cost': 0.01,
@@ -450,6 +460,27 @@ class Postgres96ParserTests(BaseParserTests, TestCase):
         self.assertEqual(test_adj_metrics['pg_stat_user_indexes.idx_scan'], 0)
         self.assertEqual(test_adj_metrics['pg_stat_user_indexes.relid'], 20)  # MetricType.INFO
 
+    def test_calculate_change_in_metrics_conversions(self):
+        # Values that numpy cannot convert directly are converted one by one
+        test_metric_start = {'pg_stat_bgwriter.buffers_alloc': '2.56e2',
+                             'pg_stat_database.tup_fetched': 2 ** 70,
+                             'pg_stat_user_tables.n_tup_upd': '123'}
+        test_metric_end = {'pg_stat_bgwriter.buffers_alloc': '300',
+                           'pg_stat_database.tup_fetched': 2 ** 70 + 104,
+                           'pg_stat_user_tables.n_tup_upd': '150'}
+
+        test_adj_metrics = self.test_dbms.calculate_change_in_metrics(
+            test_metric_start, test_metric_end)
+        self.assertEqual(test_adj_metrics, {'pg_stat_bgwriter.buffers_alloc': 44,
+                                            'pg_stat_database.tup_fetched': 104,
+                                            'pg_stat_user_tables.n_tup_upd': 27})
+        for value in list(test_adj_metrics.values()):
+            self.assertIsInstance(value, int)
+
+        test_metric_end['pg_stat_user_tables.n_tup_upd'] = '100'
+        with self.assertRaises(AssertionError):
+            self.test_dbms.calculate_change_in_metrics(test_metric_start, test_metric_end)
+
     def test_create_knob_configuration(self):
         empty_config = self.test_dbms.create_knob_configuration({})
         self.assertEqual(empty_config, {})
@@ -634,3 +665,47 @@ class Postgres96ParserTests(BaseParserTests, TestCase):
                              len(list(self.test_dbms.metric_catalog_.keys())))
             self.assertEqual(len(test_parse_log),
                              len(list(self.test_dbms.metric_catalog_.keys())) - 14)
+
+
+class ParserCacheTests(TestCase):
+
+    def setUp(self):
+        # The cached parsers and versions outlive the rollback of each test
+        for clear_cache in (CacheVersion.objects.clear_cache, Parser.clear_cache):
+            clear_cache()
+            self.addCleanup(clear_cache)
+
+    def test_catalog_change(self):
+        dbms = DBMSCatalog.objects.get(type=DBMSType.POSTGRES, version='9.6')
+        knob = KnobCatalog.objects.filter(dbms=dbms, tunable=False).first()
+        knobs = {knob.name: knob.default}
+        self.assertEqual(len(Parser.filter_tunable_knobs(dbms.pk, knobs)), 0)
+
+        # The cached parsers are recreated with the new catalog
+        knob.tunable = True
+        knob.save()
+        self.assertEqual(len(Parser.filter_tunable_knobs(dbms.pk, knobs)), 1)
+
+    def test_catalog_change_in_other_process(self):
+        dbms = DBMSCatalog.objects.get(type=DBMSType.POSTGRES, version='9.6')
+        knob = KnobCatalog.objects.filter(dbms=dbms, tunable=False).first()
+        knobs = {knob.name: knob.default}
+        self.assertEqual(len(Parser.filter_tunable_knobs(dbms.pk, knobs)), 0)
+
+        # An update by another process (e.g., by manage.py loaddata) is seen
+        # once its version of the catalogs is checked again
+        KnobCatalog.objects.filter(pk=knob.pk).update(tunable=True)
+        CacheVersion.objects.filter(name=Parser.CACHE_NAME).update(version=F('version') + 1)
+        CacheVersion.objects.get_or_create(name=Parser.CACHE_NAME, defaults={'version': 1})
+        self.assertEqual(len(Parser.filter_tunable_knobs(dbms.pk, knobs)), 0)
+        check_time = time.time() + CACHE_VERSION_CHECK_INTERVAL
+        with mock.patch('website.models.time.time', return_value=check_time):
+            self.assertEqual(len(Parser.filter_tunable_knobs(dbms.pk, knobs)), 1)
+
+    def test_version_checks(self):
+        dbms = DBMSCatalog.objects.get(type=DBMSType.POSTGRES, version='9.6')
+        Parser.filter_tunable_knobs(dbms.pk, {})
+
+        # The version of the catalogs is not read on every access
+        with self.assertNumQueries(0):
+            Parser.filter_tunable_knobs(dbms.pk, {})
@@ -4,15 +4,22 @@
 # Copyright (c) 2017-18, Carnegie Mellon University Database Group
 #
 import copy
+import mock
 import numpy as np
 from django.test import TestCase, override_settings
+from djcelery.models import TaskMeta
 
 from website.models import Workload, PipelineRun, PipelineData, Result
+from website.tasks.async_tasks import (aggregate_target_results, configuration_recommendation,
+                                       fail_superseded_results, get_superseded_results,
+                                       map_workload, recommend_configuration,
+                                       skip_superseded_tasks, update_session)
 from website.tasks.periodic_tasks import (run_background_tasks,
                                           aggregate_data,
                                           run_workload_characterization,
                                           run_knob_identification)
 from website.types import PipelineTaskType
+from website.utils import JSONUtil
 
 CELERY_TEST_RUNNER = 'djcelery.contrib.test_runner.CeleryTestSuiteRunner'
 
@@ -123,3 +130,137 @@ class RankedKnobTestCase(TestCase):
                                                workloads[0].dbms)
         for k in ranked_knobs:
             self.assertIn(k, knob_data['columnlabels'])
+
+
+@override_settings(CELERY_ALWAYS_EAGER=True, TEST_RUNNER=CELERY_TEST_RUNNER)
+class SingleTaskRecommendationTestCase(TestCase):
+
+    fixtures = ['test_website.json']
+
+    stage_task_ids = ['aggregate-task', 'map-task', 'recommend-task']
+
+    def setUp(self):
+        # The newest result is not superseded by any other result
+        self.result = Result.objects.order_by('-pk').first()
+
+    def get_statuses(self):
+        task_metas = {t.task_id: t for t in TaskMeta.objects.filter(
+            task_id__in=self.stage_task_ids)}
+        return [task_metas[task_id].status for task_id in self.stage_task_ids]
+
+    def testStagesHandOffData(self):
+        agg_data = {'newest_result_id': self.result.pk, 'bad': True, 'config_recommend': {}}
+        recommendation = {'status': 'bad', 'recommendation': {}}
+        with mock.patch.object(aggregate_target_results, 'run', return_value=agg_data), \
+                mock.patch.object(map_workload, 'run', side_effect=lambda data: data) as map_run, \
+                mock.patch.object(configuration_recommendation, 'run',
+                                  return_value=recommendation) as recommend_run, \
+                mock.patch('website.tasks.async_tasks.save_recommendation',
+                           return_value=recommendation) as save_run:
+            recommend_configuration.apply(args=(self.result.pk, self.stage_task_ids))
+        # The data of each stage is passed to the next one in memory
+        map_run.assert_called_once_with(agg_data)
+        recommend_run.assert_called_once_with(agg_data)
+        save_run.assert_called_once_with(self.result.pk, recommendation)
+        self.assertEqual(self.get_statuses(), ['SUCCESS'] * 3)
+        # Only the formatted results of the stages are saved
+        self.assertIsNone(TaskMeta.objects.get(task_id='aggregate-task').result)
+        self.assertEqual(TaskMeta.objects.get(task_id='recommend-task').result, recommendation)
+
+    def testStageFailure(self):
+        with mock.patch.object(aggregate_target_results, 'run', return_value={'bad': True}), \
+                mock.patch.object(map_workload, 'run', side_effect=ValueError('mapping')):
+            response = recommend_configuration.apply(args=(self.result.pk, self.stage_task_ids))
+        self.assertTrue(response.failed())
+        self.assertEqual(self.get_statuses(), ['SUCCESS', 'FAILURE', 'PENDING'])
+
+
+class SupersededTasksTestCase(TestCase):
+
+    fixtures = ['test_website.json']
+
+    task_ids = ['task1', 'task2', 'task3']
+
+    def setUp(self):
+        self.result = Result.objects.order_by('-pk').first()
+        self.result.task_ids = ','.join(self.task_ids)
+        self.result.next_configuration = None
+        self.result.save()
+
+    def add_newer_result(self, task_ids, next_configuration=None):
+        newer_result = Result.objects.get(pk=self.result.pk)
+        newer_result.pk = None
+        newer_result.task_ids = task_ids
+        newer_result.next_configuration = next_configuration
+        newer_result.save()
+        return newer_result
+
+    def testNotSuperseded(self):
+        # A newer result without tuner tasks does not supersede the result
+        self.add_newer_result(None)
+        self.assertFalse(skip_superseded_tasks(self.result))
+        self.assertFalse(TaskMeta.objects.filter(task_id__in=self.task_ids).exists())
+
+    def testSuperseded(self):
+        newer_result = self.add_newer_result('task4,task5,task6')
+        self.assertTrue(skip_superseded_tasks(self.result))
+        # The tasks stay pending until the newer result's recommendation is saved
+        self.assertFalse(TaskMeta.objects.filter(task_id__in=self.task_ids).exists())
+        self.assertIn(self.result, get_superseded_results(newer_result))
+
+        # Results whose tasks failed are left alone
+        TaskMeta.objects.store_result('task1', None, 'FAILURE')
+        self.assertNotIn(self.result, get_superseded_results(newer_result))
+
+    def testCoalesced(self):
+        # The newer result's recommendation is already saved
+        recommendation = {'status': 'good', 'recommendation': {}}
+        newer_result = self.add_newer_result('task4,task5,task6', JSONUtil.dumps(recommendation))
+        TaskMeta.objects.store_result('task6', recommendation, 'SUCCESS')
+        self.assertTrue(skip_superseded_tasks(self.result))
+
+        self.result.refresh_from_db()
+        self.assertEqual(self.result.next_configuration, newer_result.next_configuration)
+        statuses = TaskMeta.objects.filter(
+            task_id__in=self.task_ids).values_list('status', flat=True)
+        self.assertEqual(list(statuses), ['SUCCESS'] * 3)
+        self.assertEqual(TaskMeta.objects.get(task_id='task3').result['coalesced_result_id'],
+                         newer_result.pk)
+
+    def testNewerResultFailed(self):
+        newer_result = self.add_newer_result('task4,task5,task6')
+        self.assertTrue(skip_superseded_tasks(self.result))
+
+        # The skipped tasks fail when the newer result's tasks fail
+        TaskMeta.objects.store_result('task4', None, 'FAILURE')
+        fail_superseded_results(newer_result.pk, Exception('failed'), 'FAILURE')
+        statuses = TaskMeta.objects.filter(
+            task_id__in=self.task_ids).values_list('status', flat=True)
+        self.assertEqual(list(statuses), ['FAILURE'] * 3)
+
+        # The tasks that start afterwards are skipped and keep failing
+        TaskMeta.objects.store_result('task2', None, 'STARTED')
+        self.assertTrue(skip_superseded_tasks(self.result))
+        self.assertEqual(TaskMeta.objects.get(task_id='task2').status, 'FAILURE')
+
+
+class UpdateSessionTestCase(TestCase):
+
+    fixtures = ['test_website.json']
+
+    def testLatestResultOnlyMovesForward(self):
+        newest_result = Result.objects.order_by('-pk').first()
+        older_result = Result.objects.filter(session=newest_result.session,
+                                             pk__lt=newest_result.pk).first()
+        if older_result is None:
+            self.skipTest('The session has a single result')
+        session = newest_result.session
+        with mock.patch('website.tasks.async_tasks.Parser.get_nondefault_knob_settings',
+                        return_value={}):
+            update_session(session, newest_result.dbms, {}, newest_result)
+            # An upload stored concurrently with a stale copy of the session
+            stale_session = Result.objects.get(pk=older_result.pk).session
+            stale_session.latest_result_id = None
+            update_session(stale_session, older_result.dbms, {}, older_result)
+        session.refresh_from_db()
+        self.assertEqual(session.latest_result_id, newest_result.pk)
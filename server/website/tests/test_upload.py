@@ -3,12 +3,20 @@
 #
 # Copyright (c) 2017-18, Carnegie Mellon University Database Group
 #
+import json
 import os
+import time
+import zipfile
+from io import BytesIO
 
+import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.utils.timezone import now
+from djcelery.models import TaskMeta
 
-from website.models import Result
+from website.models import BackupData, Result, ResultIngestion, Session
 from website.settings import PROJECT_ROOT
 
 from .utils import (TEST_BASIC_SESSION_ID, TEST_BASIC_SESSION_UPLOAD_CODE,
@@ -54,6 +62,11 @@ class UploadResultsTests(TestCase):
         num_final_results = Result.objects.filter(session__id=session_id).count()
         self.assertEqual(num_final_results - num_initial_results, 1)
 
+        # The session points to its new result
+        session = Session.objects.get(pk=session_id)
+        self.assertEqual(session.latest_result_id,
+                         Result.objects.filter(session=session).order_by('pk').last().pk)
+
     def upload_to_session_fail_invalidation(self, session_id, upload_code):
         form_addr = reverse('new_result')
         post_data = {'upload_code': upload_code}
@@ -96,3 +109,124 @@ class UploadResultsTests(TestCase):
 
     def test_upload_to_tuning_session_invalid_upload_code(self):
         self.upload_to_session_invalid_upload_code(TEST_TUNING_SESSION_ID)
+
+    def test_upload_to_basic_session_async_ingestion(self):
+        num_initial_ingestions = ResultIngestion.objects.count()
+        form_addr = reverse('new_result')
+        post_data = self.open_files(self.upload_files)
+        post_data['upload_code'] = TEST_BASIC_SESSION_UPLOAD_CODE
+        with mock.patch('website.views.ASYNC_RESULT_INGESTION', True):
+            response = self.client.post(form_addr, post_data)
+        self.close_files(post_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Ingestion ID")
+        self.assertEqual(ResultIngestion.objects.count() - num_initial_ingestions, 1)
+
+    def test_upload_batch_to_basic_session_ok(self):
+        num_initial_results = Result.objects.filter(session__id=TEST_BASIC_SESSION_ID).count()
+        archive_data = BytesIO()
+        with zipfile.ZipFile(archive_data, 'w') as archive:
+            for prefix in ('sample0', 'sample1'):
+                for name, path in list(self.upload_files.items()):
+                    archive.write(path, '{}__{}.json'.format(prefix, name))
+        form_addr = reverse('new_results_batch')
+        post_data = {
+            'upload_code': TEST_BASIC_SESSION_UPLOAD_CODE,
+            'archive': SimpleUploadedFile('results.zip', archive_data.getvalue()),
+        }
+        response = self.client.post(form_addr, post_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "2 results stored successfully!")
+        num_final_results = Result.objects.filter(session__id=TEST_BASIC_SESSION_ID).count()
+        self.assertEqual(num_final_results - num_initial_results, 2)
+
+
+class QueryAndGetTests(TestCase):
+
+    fixtures = ['test_website.json']
+
+    def setUp(self):
+        self.session = Session.objects.get(pk=TEST_TUNING_SESSION_ID)
+        self.result = Result.objects.get_latest(self.session)
+        if self.result is None:
+            self.skipTest('The tuning session has no results')
+        self.url = reverse('backdoor', kwargs={'upload_code': TEST_TUNING_SESSION_UPLOAD_CODE})
+
+    def test_latest_result(self):
+        self.assertEqual(self.result.pk, Result.objects.filter(
+            session__id=TEST_TUNING_SESSION_ID).order_by('pk').last().pk)
+
+    def test_wait_for_tasks(self):
+        # The tasks never complete so the request waits until it times out
+        self.result.task_ids = 'task1,task2,task3'
+        self.result.next_configuration = None
+        self.result.save()
+        start = time.time()
+        with mock.patch('website.views.RESULT_WAIT_INTERVAL', 0.05):
+            response = self.client.get(self.url, {'wait': 0.2})
+        self.assertGreaterEqual(time.time() - start, 0.15)
+        self.assertContains(response, 'Result not ready')
+
+        # Only some of the tasks completed
+        TaskMeta.objects.store_result('task1', None, 'SUCCESS')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Result not ready')
+
+        response = self.client.get(self.url, {'wait': 'forever'})
+        self.assertContains(response, 'Invalid wait time')
+
+    def test_pending_ingestion(self):
+        # The previous result's recommendation is stale while the files of
+        # the latest upload are not stored
+        ResultIngestion.objects.create(
+            session=self.session, creation_time=now(), task_ids='ingest1,task1,task2,task3',
+            **{field: b'' for field in BackupData.RAW_FIELDS.values()})
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Result not ready')
+
+        TaskMeta.objects.store_result('ingest1', None, 'FAILURE')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Fail')
+
+    def test_ingestion_completes_while_waiting(self):
+        # The recommendation of the previous result is already available
+        self.result.task_ids = 'old1'
+        self.result.next_configuration = '{"previous": true}'
+        self.result.save()
+        TaskMeta.objects.store_result('old1', None, 'SUCCESS')
+        ingestion = ResultIngestion.objects.create(
+            session=self.session, creation_time=now(), task_ids='ingest1,new1',
+            **{field: b'' for field in BackupData.RAW_FIELDS.values()})
+
+        def complete_ingestion(_):
+            # Stores the new result and its recommendation during the wait
+            new_result = Result.objects.get(pk=self.result.pk)
+            new_result.pk = None
+            new_result.task_ids = 'new1'
+            new_result.next_configuration = '{"previous": false}'
+            new_result.save()
+            ResultIngestion.objects.filter(pk=ingestion.pk).update(result=new_result)
+            Session.objects.filter(pk=self.session.pk).update(latest_result=new_result)
+            TaskMeta.objects.store_result('ingest1', None, 'SUCCESS')
+            TaskMeta.objects.store_result('new1', None, 'SUCCESS')
+
+        with mock.patch('website.views.time.sleep', side_effect=complete_ingestion):
+            response = self.client.get(self.url, {'wait': 10})
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {'previous': False})
+
+
+class QueueStatusTests(TestCase):
+
+    fixtures = ['test_website.json']
+
+    def test_queue_status_login_required(self):
+        response = self.client.get(reverse('queue_status'))
+        self.assertRedirects(response, reverse('login') + '?next=' + reverse('queue_status'))
+
+    def test_queue_status(self):
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+        queue_status = {'tuner': {'tasks': 2, 'consumers': 1}}
+        with mock.patch('website.views.TaskUtil.get_queue_status', return_value=queue_status):
+            response = self.client.get(reverse('queue_status'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), queue_status)
@@ -5,12 +5,15 @@
 #
 
 import string
+from io import BytesIO
+
 import numpy as np
 from django.test import TestCase
+from djcelery.models import TaskMeta
 from website.utils import JSONUtil, MediaUtil, DataUtil, ConversionUtil, LabelUtil, TaskUtil
 from website.parser.postgres import PostgresParser
 from website.types import LabelStyleType, VarType
-from website.models import Result, DBMSCatalog
+from website.models import CacheVersion, DBMSCatalog, KnobCatalog, Result
 
 
 class JSONUtilTest(TestCase):
@@ -58,6 +61,9 @@ class JSONUtilTest(TestCase):
         result_str = "".join(JSONUtil.dumps(results).split())
         self.assertEqual(result_str, "".join(compress_str.split()))
 
+        file_results = JSONUtil.load(BytesIO(json_str.encode('utf-8')))
+        self.assertEqual(file_results, results)
+
 
 class MediaUtilTest(TestCase):
     def test_codegen(self):
@@ -77,6 +83,17 @@ class MediaUtilTest(TestCase):
 
 
 class TaskUtilTest(TestCase):
+
+    def test_get_tasks(self):
+        self.assertEqual(TaskUtil.get_tasks(None), [])
+        for task_id in ['task3', 'task1']:
+            TaskMeta.objects.create(task_id=task_id, status='SUCCESS')
+
+        # The finished tasks are fetched at once, in the given order
+        with self.assertNumQueries(1):
+            tasks = TaskUtil.get_tasks('task1,task2,task3')
+        self.assertEqual([t.task_id for t in tasks], ['task1', 'task3'])
+
     def test_get_task_status(self):
         # FIXME: Actually setup celery tasks instead of a dummy class?
         test_tasks = []
@@ -162,6 +179,41 @@ class DataUtilTest(TestCase):
         self.assertEqual(test_result['X_matrix'].shape[1], num_knobs)
         self.assertEqual(test_result['y_matrix'].shape[1], num_metrics)
 
+    def test_aggregate_vectors(self):
+
+        workload2 = Result.objects.filter(workload=2)
+        expected = DataUtil.aggregate_data(workload2)
+        for result in workload2:
+            for data in (result.knob_data, result.metric_data):
+                data.update_vector()
+                data.save()
+
+        test_result = DataUtil.aggregate_data(workload2)
+
+        self.assertEqual(test_result['X_columnlabels'], expected['X_columnlabels'])
+        self.assertEqual(test_result['y_columnlabels'], expected['y_columnlabels'])
+        self.assertEqual(test_result['rowlabels'], expected['rowlabels'])
+        self.assertTrue(np.array_equal(test_result['X_matrix'], expected['X_matrix']))
+        self.assertTrue(np.array_equal(test_result['y_matrix'], expected['y_matrix']))
+        self.assertIsNone(expected['X_schema_id'])
+        self.assertEqual(test_result['X_schema_id'], workload2[0].knob_data.vector_schema_id)
+        self.assertEqual(test_result['y_schema_id'], workload2[0].metric_data.vector_schema_id)
+
+    def test_aggregate_mixed_vectors(self):
+
+        # Only the metric data of the first result has a vector
+        workload2 = Result.objects.filter(workload=2).order_by('pk')
+        expected = DataUtil.aggregate_data(workload2)
+        metric_data = workload2[0].metric_data
+        metric_data.update_vector()
+        metric_data.save()
+
+        test_result = DataUtil.aggregate_data(workload2)
+
+        self.assertEqual(test_result['rowlabels'], expected['rowlabels'])
+        self.assertTrue(np.array_equal(test_result['X_matrix'], expected['X_matrix']))
+        self.assertTrue(np.array_equal(test_result['y_matrix'], expected['y_matrix']))
+
     def test_combine(self):
         test_dedup_row_labels = np.array(["Workload-0", "Workload-1"])
         test_dedup_x = np.matrix([[0.22, 5, "string", "11:11", "fsync", True],
@@ -249,6 +301,45 @@ class DataUtilTest(TestCase):
         self.assertEqual(categorical_info['cat_columnlabels'], ['global.wal_sync_method'])
         self.assertEqual(categorical_info['noncat_columnlabels'], featured_knobs[:-1])
 
+    def test_knob_metadata_cache(self):
+        featured_knobs = ['global.backend_flush_after',
+                          'global.wal_sync_method']
+        postgres96 = DBMSCatalog.objects.get(pk=1)
+        for clear_cache in (CacheVersion.objects.clear_cache, KnobCatalog.objects.clear_cache):
+            clear_cache()
+            self.addCleanup(clear_cache)
+
+        # The knob metadata is loaded in one query (after checking the
+        # version of the cache) and then cached
+        with self.assertNumQueries(2):
+            DataUtil.dummy_encoder_helper(featured_knobs, dbms=postgres96)
+        with self.assertNumQueries(0):
+            categorical_info = DataUtil.dummy_encoder_helper(featured_knobs,
+                                                             dbms=postgres96)
+        self.assertEqual(categorical_info['cat_columnlabels'], ['global.wal_sync_method'])
+
+        # A change made by another process (without signals in this one) is
+        # seen once that process bumps the version of the catalog
+        KnobCatalog.objects.filter(dbms=postgres96, name='global.wal_sync_method').update(
+            enumvals='fsync,fdatasync')
+        CacheVersion.objects.bump_version(KnobCatalog.objects.CACHE_NAME)
+        categorical_info = DataUtil.dummy_encoder_helper(featured_knobs, dbms=postgres96)
+        self.assertEqual(categorical_info['cat_columnlabels'], [])
+        KnobCatalog.objects.filter(dbms=postgres96, name='global.wal_sync_method').update(
+            enumvals='fsync,fdatasync,open_sync,open_datasync')
+        CacheVersion.objects.bump_version(KnobCatalog.objects.CACHE_NAME)
+
+        # Changing the catalog clears the cache
+        knob = KnobCatalog.objects.get(dbms=postgres96, name='global.wal_sync_method')
+        knob.enumvals = 'fsync,fdatasync'
+        knob.save()
+        categorical_info = DataUtil.dummy_encoder_helper(featured_knobs, dbms=postgres96)
+        self.assertEqual(categorical_info['cat_columnlabels'], [])
+        self.assertEqual(categorical_info['binary_vars'], [1])
+
+        with self.assertRaises(Exception):
+            DataUtil.dummy_encoder_helper(['global.FAKE_KNOB'], dbms=postgres96)
+
 
 class ConversionUtilTest(TestCase):
     def test_get_raw_size(self):
@@ -9,9 +9,19 @@ Created on Dec 13, 2017
 @author: dvanaken
 '''
 
+import json
+
 from django.contrib.auth import get_user
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from website.models import CacheVersion, MetricCatalog, MetricData, Result
+from website.parser import Parser
+from website.types import MetricType
+from website.utils import CacheUtil, JSONUtil
 
 from .utils import (TEST_BASIC_SESSION_ID, TEST_PASSWORD, TEST_PROJECT_ID, TEST_USERNAME)
 
@@ -245,3 +255,172 @@ class SessionViewsTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertRedirects(response, reverse('project_sessions',
                                                kwargs={'project_id': TEST_PROJECT_ID}))
+
+
+class DashboardViewsTests(TestCase):
+
+    fixtures = ['test_website.json']
+
+    def setUp(self):
+        result = Result.objects.select_related('session', 'workload').first()
+        self.session = result.session
+        self.workload = result.workload
+        self.results = Result.objects.filter(session=self.session, workload=self.workload)
+        self.client.force_login(self.session.user)
+        CacheUtil.clear()
+        self.addCleanup(CacheUtil.clear)
+
+    def get_timeline_data(self, **params):
+        query = {
+            'session': self.session.pk,
+            'dbms': self.session.dbms.key,
+            'wkld': self.workload.name,
+            'spe': str(self.workload.pk),
+            'nres': 2,
+        }
+        query.update(params)
+        response = self.client.get('/get_data/', query)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_timeline(self):
+        data = self.get_timeline_data()
+        self.assertEqual(len(data['results']), self.results.count())
+        self.assertIsNone(data['next_cursor'])
+
+        latest = self.results.order_by('observation_end_time', 'pk')
+        self.assertEqual([row[0] for row in data['results']], [r.pk for r in latest])
+        for timeline in data['timelines']:
+            points = timeline['data'].get(self.session.dbms.key, [])
+            self.assertEqual([int(point[3]) for point in points],
+                             [r.pk for r in latest if r.dbms_id == self.session.dbms_id][-2:])
+
+    def test_timeline_cursor(self):
+        result_ids = []
+        cursor = None
+        while True:
+            params = {'limit': 1}
+            if cursor is not None:
+                params['cursor'] = cursor
+            data = self.get_timeline_data(**params)
+            self.assertLessEqual(len(data['results']), 1)
+            result_ids.extend(row[0] for row in data['results'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+
+        # The pages go from the latest to the oldest result
+        self.assertEqual(result_ids, [r.pk for r in self.results.order_by(
+            '-observation_end_time', '-pk')])
+
+    def test_timeline_limit(self):
+        # The page size is clamped to 1..TIMELINE_PAGE_SIZE
+        data = self.get_timeline_data(limit=0)
+        self.assertEqual(len(data['results']), min(1, self.results.count()))
+        data = self.get_timeline_data(limit=-5)
+        self.assertEqual(len(data['results']), min(1, self.results.count()))
+
+        for params in ({'limit': 'all'}, {'cursor': 'first'}):
+            query = {'session': self.session.pk, 'dbms': self.session.dbms.key,
+                     'wkld': self.workload.name, 'spe': str(self.workload.pk), 'nres': 2}
+            query.update(params)
+            response = self.client.get('/get_data/', query)
+            self.assertEqual(response.status_code, 400)
+
+    def test_timeline_cache(self):
+        data = self.get_timeline_data()
+        self.results.order_by('pk').last().delete()
+
+        # The data of the session is cached until its last update changes
+        self.assertEqual(self.get_timeline_data(), data)
+        self.session.last_update = now()
+        self.session.save()
+        self.assertEqual(len(self.get_timeline_data()['results']), len(data['results']) - 1)
+
+    def get_workload_view_queries(self):
+        CacheUtil.clear()
+        url = reverse('workload', kwargs={'project_id': self.session.project_id,
+                                          'session_id': self.session.pk,
+                                          'wkld_id': self.workload.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.context['knob_confs'], len(queries)
+
+    def test_workload_view_queries(self):
+        knob_confs, num_queries = self.get_workload_view_queries()
+
+        # Add new configurations, each with a result on the workload
+        result = self.results.select_related('knob_data').first()
+        for i in range(5):
+            knob_data = result.knob_data
+            knob_data.pk = None
+            knob_data.name = 'test_knob_data_{}'.format(i)
+            knob_data.save()
+            result.pk = None
+            result.knob_data = knob_data
+            result.save()
+
+        # The number of queries does not depend on the number of configurations
+        new_knob_confs, new_num_queries = self.get_workload_view_queries()
+        self.assertEqual(len(new_knob_confs), len(knob_confs) + 5)
+        self.assertEqual(new_num_queries, num_queries)
+
+    def test_metric_data_compare(self):
+        metric_datas = list(MetricData.objects.filter(session=self.session)[:2])
+        if len(metric_datas) < 2:
+            self.skipTest('The session needs two metric data')
+        url = reverse('metric_data', kwargs={'project_id': self.session.project_id,
+                                             'session_id': self.session.pk,
+                                             'data_id': metric_datas[0].pk})
+        response = self.client.get(url, {'compare': metric_datas[1].pk})
+        self.assertEqual(response.status_code, 200)
+
+        metrics = JSONUtil.loads(metric_datas[0].metrics)
+        comp_metrics = JSONUtil.loads(metric_datas[1].metrics)
+        self.assertEqual([row[0] for row in response.context['all_data']], list(metrics.keys()))
+        for name, value, comp_value, changed in response.context['all_data']:
+            self.assertEqual(value, metrics[name])
+            self.assertEqual(comp_value, comp_metrics[name])
+            self.assertEqual(changed, value != comp_value)
+        self.assertNotIn(metric_datas[0].pk, [p.pk for p in response.context['peer_data']])
+
+        # The compared data are cached for the current version of the catalogs
+        catalog_version = CacheVersion.objects.get_version(Parser.CACHE_NAME)
+        with self.assertNumQueries(0):
+            CacheUtil.get_or_set(
+                CacheUtil.get_data_key('metrics', catalog_version, metric_datas[0].pk,
+                                       str(metric_datas[1].pk)),
+                lambda: self.fail('The compared data are not cached'))
+
+        # The featured metrics are computed again once the catalogs change
+        for clear_cache in (CacheVersion.objects.clear_cache, Parser.clear_cache,
+                            CacheUtil.clear):
+            self.addCleanup(clear_cache)
+        featured_name = response.context['featured_data'][0][0]
+        metric = MetricCatalog.objects.get(dbms=metric_datas[0].dbms, name=featured_name)
+        metric.metric_type = MetricType.INFO
+        metric.save()
+        response = self.client.get(url, {'compare': metric_datas[1].pk})
+        self.assertNotIn(featured_name, [row[0] for row in response.context['featured_data']])
+
+    def test_workload_data(self):
+        knob_data_ids = sorted(set(r.knob_data_id for r in self.results))
+        response = self.client.get('/get_workload_data/', {
+            'id': self.workload.pk,
+            'session_id': self.session.pk,
+            'conf': ','.join(str(pk) for pk in knob_data_ids),
+            'met': 'throughput_txn_per_sec',
+        })
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['metrics'], ['throughput_txn_per_sec'])
+
+        # One point per configuration, ordered by throughput
+        series = data['results'][0]
+        points = series['data'][0]
+        self.assertEqual(len(points), len(knob_data_ids))
+        self.assertEqual(len(series['tick']), len(knob_data_ids))
+        self.assertEqual(sorted(p[0] for p in points), list(range(1, len(knob_data_ids) + 1)))
+        throughputs = [p[1] for p in sorted(points, key=lambda p: -p[0])]
+        self.assertEqual([int(t) for t in throughputs], sorted(int(t) for t in throughputs))
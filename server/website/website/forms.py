@@ -22,6 +22,14 @@ class NewResultForm(forms.Form):
     summary = forms.FileField()
 
 
+class NewResultsBatchForm(forms.Form):
+    upload_code = forms.CharField(max_length=30)
+    # A zip archive containing the files of each result, named
+    # {prefix}__{knobs,metrics_before,metrics_after,summary}.json
+    archive = forms.FileField()
+    recommend = forms.BooleanField(required=False)
+
+
 class ProjectForm(forms.ModelForm):
 
     class Meta:  # pylint: disable=old-style-class,no-init
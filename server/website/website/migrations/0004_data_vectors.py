@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0003_load_initial_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabelSchema',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=40, unique=True)),
+                ('labels', models.TextField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='knobdata',
+            name='vector',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='knobdata',
+            name='vector_schema',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='website.LabelSchema'),
+        ),
+        migrations.AddField(
+            model_name='metricdata',
+            name='vector',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='metricdata',
+            name='vector_schema',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='website.LabelSchema'),
+        ),
+    ]
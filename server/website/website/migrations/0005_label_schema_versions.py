@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def assign_schema_dbms(apps, schema_editor):
+    # Schemas used to be shared by all DBMSs. Assign each one to the DBMS of
+    # the data referencing it (copying it for any other DBMS) and number the
+    # schemas of each DBMS in order of creation.
+    LabelSchema = apps.get_model('website', 'LabelSchema')
+    data_models = [apps.get_model('website', 'KnobData'),
+                   apps.get_model('website', 'MetricData')]
+    versions = {}
+    for schema in LabelSchema.objects.order_by('id'):
+        dbms_ids = set()
+        for data_model in data_models:
+            dbms_ids.update(data_model.objects.filter(vector_schema=schema)
+                            .values_list('dbms', flat=True).distinct())
+        if len(dbms_ids) == 0:
+            schema.delete()
+            continue
+        for i, dbms_id in enumerate(sorted(dbms_ids)):
+            versions[dbms_id] = versions.get(dbms_id, 0) + 1
+            if i == 0:
+                schema.dbms_id = dbms_id
+                schema.version = versions[dbms_id]
+                schema.save()
+                continue
+            dbms_schema = LabelSchema.objects.create(dbms_id=dbms_id,
+                                                     version=versions[dbms_id],
+                                                     digest=schema.digest,
+                                                     labels=schema.labels)
+            for data_model in data_models:
+                data_model.objects.filter(vector_schema=schema, dbms_id=dbms_id)\
+                    .update(vector_schema=dbms_schema)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0004_data_vectors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labelschema',
+            name='dbms',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='website.DBMSCatalog'),
+        ),
+        migrations.AddField(
+            model_name='labelschema',
+            name='version',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='labelschema',
+            name='digest',
+            field=models.CharField(max_length=40),
+        ),
+        migrations.RunPython(assign_schema_dbms, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='labelschema',
+            name='dbms',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='website.DBMSCatalog'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='labelschema',
+            unique_together=set([('dbms', 'digest'), ('dbms', 'version')]),
+        ),
+        migrations.AddField(
+            model_name='pipelinedata',
+            name='schema',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='website.LabelSchema'),
+        ),
+    ]
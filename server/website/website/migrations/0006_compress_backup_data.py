@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+
+import zlib
+
+from django.db import migrations, models
+
+RAW_FIELDS = [
+    'raw_knobs',
+    'raw_initial_metrics',
+    'raw_final_metrics',
+    'raw_summary',
+]
+
+
+def compress_backup_data(apps, schema_editor):
+    BackupData = apps.get_model('website', 'BackupData')
+    for backup_data in BackupData.objects.all().iterator():
+        BackupData.objects.filter(pk=backup_data.pk).update(
+            **{f: zlib.compress(bytes(getattr(backup_data, f))) for f in RAW_FIELDS})
+
+
+def decompress_backup_data(apps, schema_editor):
+    BackupData = apps.get_model('website', 'BackupData')
+    for backup_data in BackupData.objects.all().iterator():
+        BackupData.objects.filter(pk=backup_data.pk).update(
+            **{f: zlib.decompress(bytes(getattr(backup_data, f))) for f in RAW_FIELDS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0005_label_schema_versions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='backupdata',
+            name=field_name,
+            field=models.BinaryField(),
+        ) for field_name in RAW_FIELDS
+    ] + [
+        migrations.RunPython(compress_backup_data, decompress_backup_data),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0006_compress_backup_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultIngestion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creation_time', models.DateTimeField()),
+                ('task_ids', models.CharField(max_length=240, null=True)),
+                ('raw_knobs', models.BinaryField()),
+                ('raw_initial_metrics', models.BinaryField()),
+                ('raw_final_metrics', models.BinaryField()),
+                ('raw_summary', models.BinaryField()),
+                ('result', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='website.Result')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='website.Session')),
+            ],
+        ),
+    ]
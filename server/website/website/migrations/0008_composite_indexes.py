@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0007_resultingestion'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='result',
+            index_together=set([('session', 'dbms', 'workload'),
+                                ('session', 'workload', 'knob_data', 'observation_end_time')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='pipelinedata',
+            index_together=set([('pipeline_run', 'workload')]),
+        ),
+    ]
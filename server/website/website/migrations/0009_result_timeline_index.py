@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0008_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='result',
+            index_together=set([('session', 'dbms', 'workload'),
+                                ('session', 'workload', 'knob_data', 'observation_end_time'),
+                                ('session', 'observation_end_time')]),
+        ),
+    ]
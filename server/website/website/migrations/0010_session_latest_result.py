@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_latest_results(apps, schema_editor):
+    Result = apps.get_model('website', 'Result')
+    Session = apps.get_model('website', 'Session')
+    latest_results = Result.objects.values('session').annotate(latest_id=models.Max('id'))
+    for latest in latest_results:
+        Session.objects.filter(pk=latest['session']).update(latest_result=latest['latest_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0009_result_timeline_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='latest_result',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='website.Result'),
+        ),
+        migrations.RunPython(set_latest_results, migrations.RunPython.noop),
+    ]
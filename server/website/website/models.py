@@ -3,13 +3,23 @@
 #
 # Copyright (c) 2017-18, Carnegie Mellon University Database Group
 #
+import hashlib
+import json
+import time
+import zlib
 from collections import namedtuple, OrderedDict
 
+import numpy as np
 from django.contrib.auth.models import User
 from django.core.validators import validate_comma_separated_integer_list
-from django.db import models, DEFAULT_DB_ALIAS
+from django.db import models, transaction, DatabaseError, DEFAULT_DB_ALIAS, IntegrityError
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Concat
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.timezone import now
 
+from .settings import CACHE_VERSION_CHECK_INTERVAL  # pylint: disable=no-name-in-module
 from .types import (DBMSType, LabelStyleType, MetricType, HardwareType,
                     KnobUnitType, PipelineTaskType, VarType, KnobResourceType)
 
@@ -46,6 +56,54 @@ class BaseModel(models.Model):
         abstract = True
 
 
+class CacheVersionManager(models.Manager):
+
+    # The versions last read by this process and when they were read
+    _checked_versions = {}
+
+    def get_version(self, name):
+        return self.filter(name=name).values_list('version', flat=True).first() or 0
+
+    def get_checked_version(self, name):
+        # The version is read at most once every CACHE_VERSION_CHECK_INTERVAL
+        # seconds so the cached data is not checked with a query on every
+        # access. Changes made by other processes are seen after that long.
+        checked = self._checked_versions.get(name, None)
+        current_time = time.time()
+        if checked is None or current_time - checked[1] >= CACHE_VERSION_CHECK_INTERVAL:
+            checked = (self.get_version(name), current_time)
+            self._checked_versions[name] = checked
+        return checked[0]
+
+    def bump_version(self, name):
+        try:
+            with transaction.atomic():
+                if self.filter(name=name).update(version=F('version') + 1) == 0:
+                    self.create(name=name, version=1)
+        except DatabaseError:
+            # The table does not exist yet while the migrations load the
+            # initial catalogs, which are not cached by any process then
+            pass
+        # This process sees its own changes right away
+        self._checked_versions.pop(name, None)
+
+    @classmethod
+    def clear_cache(cls):
+        cls._checked_versions.clear()
+
+
+class CacheVersion(models.Model):
+    # Data cached by each process (e.g., the knob catalog metadata) is
+    # checked against the version of its cache on every access. The version
+    # is bumped whenever the data changes, so the caches of all the processes
+    # (web servers, celery workers) are invalidated even when the data was
+    # changed by another process such as manage.py loaddata.
+    objects = CacheVersionManager()
+
+    name = models.CharField(max_length=64, unique=True)
+    version = models.IntegerField(default=0)
+
+
 class DBMSCatalog(BaseModel):
     type = models.IntegerField(choices=DBMSType.choices())
     version = models.CharField(max_length=16)
@@ -66,7 +124,46 @@ class DBMSCatalog(BaseModel):
         return self.full_name
 
 
+KnobMeta = namedtuple('KnobMeta',
+                      ['name', 'vartype', 'unit', 'enumvals', 'default', 'minval',
+                       'maxval', 'tunable', 'resource'])
+
+
+class KnobCatalogManager(models.Manager):
+
+    # The knob metadata of each DBMS is loaded in a single query and cached
+    # in the process. The cache is cleared whenever the version of the knob
+    # catalog changes (see CacheVersion), including when its fixtures are
+    # reloaded by another process (after CACHE_VERSION_CHECK_INTERVAL).
+    CACHE_NAME = 'knob_catalog'
+    _metadata_cache = {}
+    _cache_version = None
+
+    def get_metadata(self, dbms):
+        version = CacheVersion.objects.get_checked_version(self.CACHE_NAME)
+        if version != KnobCatalogManager._cache_version:
+            self.clear_cache()
+            KnobCatalogManager._cache_version = version
+        dbms_id = getattr(dbms, 'pk', dbms)
+        metadata = self._metadata_cache.get(dbms_id, None)
+        if metadata is None:
+            rows = self.filter(dbms__pk=dbms_id).order_by('name').values_list(*KnobMeta._fields)
+            metadata = OrderedDict((row[0], KnobMeta(*row)) for row in rows)
+            self._metadata_cache[dbms_id] = metadata
+        return metadata
+
+    def get_tunable_metadata(self, dbms, resource=None):
+        return OrderedDict((name, meta) for name, meta in self.get_metadata(dbms).items()
+                           if meta.tunable and (resource is None or meta.resource == resource))
+
+    @classmethod
+    def clear_cache(cls):
+        cls._metadata_cache.clear()
+
+
 class KnobCatalog(BaseModel):
+    objects = KnobCatalogManager()
+
     dbms = models.ForeignKey(DBMSCatalog)
     name = models.CharField(max_length=128)
     vartype = models.IntegerField(choices=VarType.choices(), verbose_name="variable type")
@@ -84,6 +181,12 @@ class KnobCatalog(BaseModel):
     resource = models.IntegerField(choices=KnobResourceType.choices(), default=4)
 
 
+@receiver([post_save, post_delete], sender=KnobCatalog)
+def clear_knob_metadata_cache(sender, **kwargs):  # pylint: disable=unused-argument
+    CacheVersion.objects.bump_version(KnobCatalogManager.CACHE_NAME)
+    KnobCatalogManager.clear_cache()
+
+
 MetricMeta = namedtuple('MetricMeta',
                         ['name', 'pprint', 'unit', 'short_unit', 'scale', 'improvement'])
 
@@ -206,6 +309,11 @@ class Session(BaseModel):
     target_objective = models.CharField(choices=TARGET_OBJECTIVES, max_length=64, null=True)
     nondefault_settings = models.TextField(null=True)
 
+    # The session's latest result, so polling for it does not need to scan
+    # the results of the session
+    latest_result = models.ForeignKey('Result', null=True, related_name='+',
+                                      on_delete=models.SET_NULL)
+
     def clean(self):
         if self.target_objective is None:
             self.target_objective = MetricManager.get_default_objective_function()
@@ -220,6 +328,68 @@ class Session(BaseModel):
         super(Session, self).delete(using=DEFAULT_DB_ALIAS, keep_parents=False)
 
 
+class LabelSchemaManager(models.Manager):
+
+    # Schemas are never modified once created so their labels can be cached
+    # by id for the lifetime of the process
+    _labels_cache = {}
+
+    @staticmethod
+    def get_digest(labels):
+        return hashlib.sha1(json.dumps(labels).encode('utf-8')).hexdigest()
+
+    def get_or_create_schema(self, dbms, labels):
+        # Each distinct list of labels of a DBMS gets a new version
+        labels = list(labels)
+        digest = self.get_digest(labels)
+        try:
+            return self.get(dbms=dbms, digest=digest)
+        except LabelSchema.DoesNotExist:
+            pass
+        latest = self.filter(dbms=dbms).aggregate(models.Max('version'))['version__max']
+        try:
+            with transaction.atomic():
+                return self.create(dbms=dbms, version=(latest or 0) + 1,
+                                   digest=digest, labels=json.dumps(labels))
+        except IntegrityError:
+            # Another process created the schema (or version) first
+            try:
+                return self.get(dbms=dbms, digest=digest)
+            except LabelSchema.DoesNotExist:
+                return self.get_or_create_schema(dbms, labels)
+
+    def get_labels(self, schema_id):
+        labels = self._labels_cache.get(schema_id, None)
+        if labels is None:
+            labels = self.get(pk=schema_id).get_labels()
+            self._labels_cache[schema_id] = labels
+        return labels
+
+    @staticmethod
+    def labels_match(schema_id1, labels1, schema_id2, labels2):
+        # Schemas are unique per (dbms, labels) so for data of the same DBMS
+        # comparing the schema ids is enough. The labels are only compared
+        # for data saved without a schema.
+        if schema_id1 is not None and schema_id2 is not None:
+            return schema_id1 == schema_id2
+        return list(labels1) == list(labels2)
+
+
+class LabelSchema(models.Model):
+    objects = LabelSchemaManager()
+
+    dbms = models.ForeignKey(DBMSCatalog)
+    version = models.IntegerField()
+    digest = models.CharField(max_length=40)
+    labels = models.TextField()
+
+    def get_labels(self):
+        return json.loads(self.labels)
+
+    class Meta:  # pylint: disable=old-style-class,no-init
+        unique_together = (("dbms", "digest"), ("dbms", "version"))
+
+
 class DataModel(BaseModel):
     session = models.ForeignKey(Session)
     name = models.CharField(max_length=50)
@@ -227,16 +397,110 @@ class DataModel(BaseModel):
     data = models.TextField()
     dbms = models.ForeignKey(DBMSCatalog)
 
+    # Numeric copy of the data: a float64 vector whose values are ordered by
+    # the (shared) labels of the schema. Null if the data is not numeric.
+    vector = models.BinaryField(null=True)
+    vector_schema = models.ForeignKey(LabelSchema, null=True, related_name='+')
+
+    VECTOR_DTYPE = '<f8'
+
+    def update_vector(self):
+        from .utils import JSONUtil
+
+        data = JSONUtil.loads(self.data)
+        try:
+            values = np.array(list(data.values()), dtype=self.VECTOR_DTYPE)
+        except (TypeError, ValueError):
+            self.vector = None
+            self.vector_schema = None
+            return
+        self.vector = values.tobytes()
+        self.vector_schema = LabelSchema.objects.get_or_create_schema(self.dbms, data.keys())
+
+    def get_values(self):
+        # Returns the numeric data as an OrderedDict, reading it from the
+        # vector when available so that the JSON data is not reparsed
+        from .utils import JSONUtil
+
+        if self.vector is None:
+            return JSONUtil.loads(self.data)
+        labels = LabelSchema.objects.get_labels(self.vector_schema_id)
+        values = np.frombuffer(self.vector, dtype=self.VECTOR_DTYPE)
+        return OrderedDict(zip(labels, values.tolist()))
+
     class Meta:  # pylint: disable=old-style-class,no-init
         abstract = True
 
 
+def bulk_create_with_ids(manager, objs, **filters):
+    # Unlike on PostgreSQL, bulk_create does not set the ids of the new
+    # objects on MySQL. The rows inserted by a single statement get
+    # increasing ids that are all greater than the existing ones, so they
+    # are read back in order as the ids above the largest id (among the rows
+    # matching the filters) before the insert.
+    if len(objs) == 0:
+        return objs
+    last_id = manager.filter(**filters).aggregate(models.Max('id'))['id__max'] or 0
+    manager.bulk_create(objs)
+    if any(obj.pk is None for obj in objs):
+        ids = list(manager.filter(id__gt=last_id, **filters).order_by('id')
+                   .values_list('id', flat=True))
+        if len(ids) != len(objs):
+            raise Exception('Could not read back the ids of the {} new {} objects'.format(
+                len(objs), manager.model.__name__))
+        for obj, obj_id in zip(objs, ids):
+            obj.pk = obj_id
+    return objs
+
+
 class DataManager(models.Manager):
 
     @staticmethod
     def create_name(data_obj, key):
+        return DataManager._get_name_prefix(data_obj, key) + str(data_obj.pk)
+
+    @staticmethod
+    def _get_name_prefix(data_obj, key):
         ts = data_obj.creation_time.strftime("%m-%d-%y")
-        return (key + '@' + ts + '#' + str(data_obj.pk))
+        return key + '@' + ts + '#'
+
+    def bulk_create_data(self, session, dbms, data_objs):
+        # Bulk inserts new data objects of the session that were all created
+        # at the same time, then names them (with a single update since the
+        # names only differ by their ids)
+        bulk_create_with_ids(self, data_objs, session=session)
+        if len(data_objs) > 0:
+            prefix = self._get_name_prefix(data_objs[0], dbms.key)
+            self.filter(id__in=[obj.pk for obj in data_objs]).update(
+                name=Concat(Value(prefix), Cast('id', models.CharField())))
+            for obj in data_objs:
+                obj.name = prefix + str(obj.pk)
+        return data_objs
+
+    def get_selected_values(self, data_objs, names):
+        # Reads only the values of the given names from the vectors of the
+        # data objects (which can be loaded with their JSON data deferred).
+        # The JSON data of the objects without a vector is loaded at once.
+        positions = {}
+        values = {}
+        missing_ids = []
+        for obj in data_objs:
+            if obj.vector is None:
+                missing_ids.append(obj.pk)
+                continue
+            idxs = positions.get(obj.vector_schema_id, None)
+            if idxs is None:
+                labels = LabelSchema.objects.get_labels(obj.vector_schema_id)
+                label_idxs = {label: i for i, label in enumerate(labels)}
+                idxs = [label_idxs[name] for name in names]
+                positions[obj.vector_schema_id] = idxs
+            vector = np.frombuffer(obj.vector, dtype=DataModel.VECTOR_DTYPE)
+            values[obj.pk] = vector[idxs].tolist()
+        if len(missing_ids) > 0:
+            for obj_id, data in self.filter(pk__in=missing_ids).values_list('pk', 'data'):
+                data = json.loads(data)
+                values[obj_id] = [data[name] for name in names]
+        return values
 
 
 class KnobDataManager(DataManager):
@@ -252,6 +516,7 @@ class KnobDataManager(DataManager):
                                     dbms=dbms,
                                     creation_time=now())
             knob_data.name = self.create_name(knob_data, dbms.key)
+            knob_data.update_vector()
             knob_data.save()
             return knob_data
 
@@ -271,6 +536,7 @@ class MetricDataManager(DataManager):
                                   dbms=dbms,
                                   creation_time=now())
         metric_data.name = self.create_name(metric_data, dbms.key)
+        metric_data.update_vector()
         metric_data.save()
         return metric_data
 
@@ -335,6 +601,13 @@ class Workload(BaseModel):
 
 class ResultManager(models.Manager):
 
+    def get_latest(self, session):
+        # The latest result is the one with the largest id. Its pointer is
+        # only missing if the latest result was deleted.
+        if session.latest_result_id is not None:
+            return session.latest_result
+        return self.filter(session=session).order_by('-id').first()
+
     def create_result(self, session, dbms, workload,
                       knob_data, metric_data,
                       observation_start_time,
@@ -355,6 +628,9 @@ class ResultManager(models.Manager):
             next_configuration=next_config,
             creation_time=now())
 
+    def bulk_create_results(self, session, results):
+        return bulk_create_with_ids(self, results, session=session)
+
 
 class Result(BaseModel):
     objects = ResultManager()
@@ -375,6 +651,15 @@ class Result(BaseModel):
     def __unicode__(self):
         return str(self.pk)
 
+    class Meta:  # pylint: disable=old-style-class,no-init
+        # Composite indexes for the hot filters (the target results of a
+        # session and the latest result of each knob configuration)
+        index_together = [
+            ("session", "dbms", "workload"),
+            ("session", "workload", "knob_data", "observation_end_time"),
+            ("session", "observation_end_time"),
+        ]
+
 
 class PipelineRunManager(models.Manager):
 
@@ -398,16 +683,106 @@ class PipelineData(models.Model):
     workload = models.ForeignKey(Workload)
     data = models.TextField()
     creation_time = models.DateTimeField()
+    # The label schema of the columns of the knob/metric data, which are then
+    # not repeated in the data
+    schema = models.ForeignKey(LabelSchema, null=True)
+
+    def get_data(self):
+        from .utils import JSONUtil
+
+        data = JSONUtil.loads(self.data)
+        if self.schema_id is not None:
+            data['columnlabels'] = LabelSchema.objects.get_labels(self.schema_id)
+        return data
 
     class Meta:  # pylint: disable=old-style-class,no-init
         unique_together = ("pipeline_run", "task_type", "workload")
+        # The pipeline data of a run is looked up by workload (i.e., dbms and
+        # hardware) for all task types at once
+        index_together = [("pipeline_run", "workload")]
+
+
+class BackupDataManager(models.Manager):
+
+    @staticmethod
+    def compress_file(uploaded_file):
+        # Compresses the file chunk by chunk so its contents are never fully
+        # loaded in memory
+        compressor = zlib.compressobj()
+        data = [compressor.compress(chunk) for chunk in uploaded_file.chunks()]
+        data.append(compressor.flush())
+        # chunks() leaves the file at its end. Rewind it so the file can
+        # still be parsed after it is compressed.
+        uploaded_file.seek(0)
+        return b''.join(data)
+
+    @staticmethod
+    def compress_files(files):
+        return {name: BackupDataManager.compress_file(files[name])
+                for name in BackupData.RAW_FIELDS}
+
+    def create_backup_data(self, result, raw_files, knob_log, metric_log):
+        raw_data = {field: raw_files[name] for name, field in BackupData.RAW_FIELDS.items()}
+        return self.create(result=result,
+                           knob_log=knob_log,
+                           metric_log=metric_log,
+                           **raw_data)
 
 
 class BackupData(BaseModel):
+    objects = BackupDataManager()
+
+    # Maps the names of the files uploaded by the controller to the fields
+    # storing their raw contents
+    RAW_FIELDS = OrderedDict([
+        ('knobs', 'raw_knobs'),
+        ('metrics_before', 'raw_initial_metrics'),
+        ('metrics_after', 'raw_final_metrics'),
+        ('summary', 'raw_summary'),
+    ])
+
     result = models.ForeignKey(Result)
-    raw_knobs = models.TextField()
-    raw_initial_metrics = models.TextField()
-    raw_final_metrics = models.TextField()
-    raw_summary = models.TextField()
+
+    # The raw files uploaded by the controller (zlib-compressed)
+    raw_knobs = models.BinaryField()
+    raw_initial_metrics = models.BinaryField()
+    raw_final_metrics = models.BinaryField()
+    raw_summary = models.BinaryField()
     knob_log = models.TextField()
     metric_log = models.TextField()
+
+
+class ResultIngestionManager(models.Manager):
+
+    def get_pending(self, session):
+        # Returns the latest ingestion of the session if its result is not
+        # stored yet (or could not be stored)
+        ingestion = self.filter(session=session).only(
+            'task_ids', 'result').order_by('-id').first()
+        if ingestion is None or ingestion.result_id is not None:
+            return None
+        return ingestion
+
+
+class ResultIngestion(models.Model):
+    objects = ResultIngestionManager()
+
+    session = models.ForeignKey(Session)
+    creation_time = models.DateTimeField()
+    task_ids = models.CharField(max_length=240, null=True)
+    result = models.ForeignKey(Result, null=True)
+
+    # The raw files uploaded by the controller (zlib-compressed). They are
+    # moved to the BackupData of the result once it has been stored.
+    raw_knobs = models.BinaryField()
+    raw_initial_metrics = models.BinaryField()
+    raw_final_metrics = models.BinaryField()
+    raw_summary = models.BinaryField()
+
+    def get_raw_files(self):
+        return {name: bytes(getattr(self, field))
+                for name, field in BackupData.RAW_FIELDS.items()}
+
+    def clear_raw_files(self):
+        for field in BackupData.RAW_FIELDS.values():
+            setattr(self, field, b'')
@@ -12,15 +12,27 @@ Parser interface.
 '''
 
 from abc import ABCMeta, abstractmethod, abstractproperty
-from collections import OrderedDict
+from collections import namedtuple, OrderedDict
+
+import numpy as np
 
 from website.models import KnobCatalog, MetricCatalog
 from website.types import BooleanType, MetricType, VarType
 
 
+# The metrics grouped by how their values are converted: the integer/real
+# metric columns (with masks of the metrics reported as their change), the
+# other metrics, and the numeric metric column (with a mask of the counters)
+MetricLayout = namedtuple('MetricLayout', ['columns', 'other_names', 'numeric_names',
+                                           'numeric_metadata', 'numeric_counters'])
+
+
 # pylint: disable=no-self-use
 class BaseParser(object, metaclass=ABCMeta):
 
+    # Maximum number of metric layouts cached by a parser
+    MAX_METRIC_LAYOUTS = 16
+
     def __init__(self, dbms_id):
         self.dbms_id_ = dbms_id
         knobs = KnobCatalog.objects.filter(dbms__pk=self.dbms_id_)
@@ -33,6 +45,16 @@ class BaseParser(object, metaclass=ABCMeta):
                                         list(self.metric_catalog_.items()) if
                                         v.metric_type == MetricType.COUNTER or
                                         v.metric_type == MetricType.STATISTICS}
+        # Lowercase lookup tables of the catalogs, used to match the names of
+        # the uploaded variables
+        self.lc_knob_catalog_ = self.lowercase_catalog(self.knob_catalog_)
+        self.lc_metric_catalog_ = self.lowercase_catalog(self.metric_catalog_)
+        self.numeric_metric_names_ = list(self.numeric_metric_catalog_.keys())
+        self.numeric_metric_metadata_ = list(self.numeric_metric_catalog_.values())
+        self.numeric_metric_counters_ = np.array(
+            [m.metric_type == MetricType.COUNTER for m in self.numeric_metric_metadata_],
+            dtype=bool)
+        self.metric_layouts_ = {}
         self.valid_true_val = list()
         self.valid_false_val = list()
 
@@ -158,21 +180,77 @@ class BaseParser(object, metaclass=ABCMeta):
     def _check_knob_bool_val(self, value):
         return value in self.valid_true_val or value in self.valid_false_val
 
+    def get_metric_metadata(self, name):
+        return self.metric_catalog_[name]
+
+    def get_numeric_metric_metadata(self, name):
+        return self.numeric_metric_catalog_.get(name, None)
+
+    def is_delta_metric(self, metadata):
+        return metadata.metric_type == MetricType.COUNTER
+
+    def get_metric_layout(self, names):
+        # The layouts are cached since the same metrics are uploaded over and
+        # over again
+        key = tuple(names)
+        layout = self.metric_layouts_.get(key, None)
+        if layout is not None:
+            return layout
+
+        columns = OrderedDict([(VarType.INTEGER, ([], [])), (VarType.REAL, ([], []))])
+        other_names = []
+        numeric_names = []
+        numeric_metadata = []
+        for name in names:
+            metadata = self.get_metric_metadata(name)
+            if metadata.vartype in columns:
+                columns[metadata.vartype][0].append(name)
+                columns[metadata.vartype][1].append(metadata)
+            else:
+                other_names.append(name)
+            metadata = self.get_numeric_metric_metadata(name)
+            if metadata is not None:
+                numeric_names.append(name)
+                numeric_metadata.append(metadata)
+        layout = MetricLayout(
+            columns=[(vartype, col_names, col_metadata,
+                      np.array([self.is_delta_metric(m) for m in col_metadata], dtype=bool))
+                     for vartype, (col_names, col_metadata) in columns.items()],
+            other_names=other_names,
+            numeric_names=numeric_names,
+            numeric_metadata=numeric_metadata,
+            numeric_counters=np.array(
+                [m.metric_type == MetricType.COUNTER for m in numeric_metadata], dtype=bool))
+
+        if len(self.metric_layouts_) >= self.MAX_METRIC_LAYOUTS:
+            self.metric_layouts_.clear()
+        self.metric_layouts_[key] = layout
+        return layout
+
+    def convert_metric_column(self, values, vartype, metadata):
+        # Converts all values at once unless some of them have a special
+        # format (e.g., a unit) or do not fit in an int64
+        dtype = np.int64 if vartype == VarType.INTEGER else np.float64
+        try:
+            return np.array(values, dtype=dtype)
+        except (TypeError, ValueError, OverflowError):
+            conversion_fn = self.convert_integer if vartype == VarType.INTEGER \
+                else self.convert_real
+            return np.array([conversion_fn(v, m) for v, m in zip(values, metadata)])
+
+    def convert_numeric_metrics(self, metrics, names, metadata, counters, observation_time):
+        # Counters are converted to rates over the observation time
+        values = self.convert_metric_column([metrics[name] for name in names],
+                                            VarType.INTEGER, metadata).astype(np.float64)
+        values[counters] /= observation_time
+        return dict(zip(names, values.tolist()))
+
     def convert_dbms_metrics(self, metrics, observation_time, target_objective=None):
         #         if len(metrics) != len(self.numeric_metric_catalog_):
         #             raise Exception('The number of metrics should be equal!')
-        metric_data = {}
-        for name, metadata in list(self.numeric_metric_catalog_.items()):
-            value = metrics[name]
-            if metadata.metric_type == MetricType.COUNTER:
-                converted = self.convert_integer(value, metadata)
-                metric_data[name] = float(converted) / observation_time
-            elif metadata.metric_type == MetricType.STATISTICS:
-                converted = self.convert_integer(value, metadata)
-                metric_data[name] = float(converted)
-            else:
-                raise Exception(
-                    'Unknown metric type for {}: {}'.format(name, metadata.metric_type))
+        metric_data = self.convert_numeric_metrics(
+            metrics, self.numeric_metric_names_, self.numeric_metric_metadata_,
+            self.numeric_metric_counters_, observation_time)
 
         if target_objective is not None and self.target_metric(target_objective) not in metric_data:
             raise Exception("Cannot find objective function")
@@ -187,18 +265,26 @@ class BaseParser(object, metaclass=ABCMeta):
         return metric_data
 
     @staticmethod
-    def extract_valid_variables(variables, catalog, default_value=None):
+    def lowercase_catalog(catalog):
+        return {k.lower(): v for k, v in list(catalog.items())}
+
+    @staticmethod
+    def extract_valid_variables(variables, catalog, default_value=None, lc_catalog=None):
         valid_variables = {}
         diff_log = []
-        valid_lc_variables = {k.lower(): v for k, v in list(catalog.items())}
+        # The parsers pass the precompiled lowercase table of the catalog
+        valid_lc_variables = lc_catalog if lc_catalog is not None else \
+            BaseParser.lowercase_catalog(catalog)
 
         # First check that the names of all variables are valid (i.e., listed
         # in the official catalog). Invalid variables are logged as 'extras'.
         # Variable names that are valid but differ in capitalization are still
         # added to valid_variables but with the proper capitalization. They
         # are also logged as 'miscapitalized'.
+        lc_variables = set()
         for var_name, var_value in list(variables.items()):
             lc_var_name = var_name.lower()
+            lc_variables.add(lc_var_name)
             if lc_var_name in valid_lc_variables:
                 valid_name = valid_lc_variables[lc_var_name].name
                 if var_name != valid_name:
@@ -211,7 +297,6 @@ class BaseParser(object, metaclass=ABCMeta):
         # variables. Missing variables are added to valid_variables with the given
         # default_value if provided (or the item's actual default value if not) and
         # logged as 'missing'.
-        lc_variables = {k.lower(): v for k, v in list(variables.items())}
         for valid_lc_name, metadata in list(valid_lc_variables.items()):
             if valid_lc_name not in lc_variables:
                 diff_log.append(('missing', metadata.name, None, None))
@@ -254,7 +339,7 @@ class BaseParser(object, metaclass=ABCMeta):
             valid_knobs[k] = valid_knobs[k][0]
         # Extract all valid knobs
         return BaseParser.extract_valid_variables(
-            valid_knobs, self.knob_catalog_)
+            valid_knobs, self.knob_catalog_, lc_catalog=self.lc_knob_catalog_)
 
     def parse_dbms_metrics(self, metrics):
         # Some DBMSs measure different types of stats (e.g., global, local)
@@ -264,7 +349,8 @@ class BaseParser(object, metaclass=ABCMeta):
 
         # Extract all valid metrics
         valid_metrics, diffs = BaseParser.extract_valid_variables(
-            valid_metrics, self.metric_catalog_, default_value='0')
+            valid_metrics, self.metric_catalog_, default_value='0',
+            lc_catalog=self.lc_metric_catalog_)
 
         # Combine values
         for name, values in list(valid_metrics.items()):
@@ -273,38 +359,48 @@ class BaseParser(object, metaclass=ABCMeta):
                 valid_metrics[name] = values[0]
             elif metric.metric_type == MetricType.COUNTER or \
                     metric.metric_type == MetricType.STATISTICS:
-                values = [int(v) for v in values if v is not None]
+                values = [v for v in values if v is not None]
                 if len(values) == 0:
                     valid_metrics[name] = 0
                 else:
-                    valid_metrics[name] = str(sum(values))
+                    valid_metrics[name] = str(self.sum_metric_values(values))
             else:
                 raise Exception(
                     'Invalid metric type: {}'.format(metric.metric_type))
         return valid_metrics, diffs
 
+    @staticmethod
+    def sum_metric_values(values):
+        # Numpy sums wrap around silently when they overflow, so the values
+        # are only summed by numpy if their sum is sure to fit in an int64
+        try:
+            array = np.array(values, dtype=np.int64)
+        except OverflowError:
+            array = None
+        if array is not None and len(array) > 0:
+            max_abs_value = max(abs(int(array.max())), abs(int(array.min())))
+            if max_abs_value * len(array) <= np.iinfo(np.int64).max:
+                return int(array.sum())
+        return sum(int(v) for v in values)
+
     def calculate_change_in_metrics(self, metrics_start, metrics_end):
         adjusted_metrics = {}
-        for met_name, start_val in list(metrics_start.items()):
-            end_val = metrics_end[met_name]
-            met_info = self.metric_catalog_[met_name]
-            if met_info.vartype == VarType.INTEGER or \
-                    met_info.vartype == VarType.REAL:
-                conversion_fn = self.convert_integer if \
-                    met_info.vartype == VarType.INTEGER else \
-                    self.convert_real
-                start_val = conversion_fn(start_val, met_info)
-                end_val = conversion_fn(end_val, met_info)
-                if met_info.metric_type == MetricType.COUNTER:
-                    adj_val = end_val - start_val
-                else:  # MetricType.STATISTICS or MetricType.INFO
-                    adj_val = end_val
-                assert adj_val >= 0
-                adjusted_metrics[met_name] = adj_val
-            else:
-                # This metric is either a bool, enum, string, or timestamp
-                # so take last recorded value from metrics_end
-                adjusted_metrics[met_name] = end_val
+        layout = self.get_metric_layout(list(metrics_start.keys()))
+        for vartype, names, metadata, deltas in layout.columns:
+            start_vals = self.convert_metric_column(
+                [metrics_start[name] for name in names], vartype, metadata)
+            end_vals = self.convert_metric_column(
+                [metrics_end[name] for name in names], vartype, metadata)
+            # MetricType.STATISTICS or MetricType.INFO metrics keep their
+            # end values
+            adj_vals = np.where(deltas, end_vals - start_vals, end_vals)
+            assert np.all(adj_vals >= 0)
+            adjusted_metrics.update(zip(names, adj_vals.tolist()))
+
+        # The other metrics are either bools, enums, strings, or timestamps
+        # so take last recorded value from metrics_end
+        for name in layout.other_names:
+            adjusted_metrics[name] = metrics_end[name]
         return adjusted_metrics
 
     def create_knob_configuration(self, tuning_knobs):
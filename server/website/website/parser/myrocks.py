@@ -11,10 +11,13 @@ Created on Jan 16, 2018
 
 import re
 from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
 
 from .base import BaseParser
 from website.models import DBMSCatalog
-from website.types import DBMSType, KnobUnitType, MetricType, VarType
+from website.types import DBMSType, KnobUnitType, VarType
 from website.utils import ConversionUtil
 
 
@@ -136,6 +139,7 @@ class MyRocksParser(BaseParser):
     # variable remains same. This is because local varialbe in knob_catalog is in
     # parial format (i,e. viewname.varname)
     @staticmethod
+    @lru_cache(maxsize=2 ** 16)
     def partial_name(full_name):
         var_name = full_name.split('.')
         if len(var_name) == 2:  # global variable
@@ -146,19 +150,23 @@ class MyRocksParser(BaseParser):
             raise Exception('Invalid variable full name: {}'.format(full_name))
 
     @staticmethod
-    def extract_valid_variables(variables, catalog, default_value=None):
+    def extract_valid_variables(variables, catalog, default_value=None, lc_catalog=None):
         valid_variables = {}
         diff_log = []
-        valid_lc_variables = {k.lower(): v for k, v in list(catalog.items())}
+        # The parsers pass the precompiled lowercase table of the catalog
+        valid_lc_variables = lc_catalog if lc_catalog is not None else \
+            BaseParser.lowercase_catalog(catalog)
 
         # First check that the names of all variables are valid (i.e., listed
         # in the official catalog). Invalid variables are logged as 'extras'.
         # Variable names that are valid but differ in capitalization are still
         # added to valid_variables but with the proper capitalization. They
         # are also logged as 'miscapitalized'.
+        lc_variables = set()
         for var_name, var_value in list(variables.items()):
             lc_var_name = var_name.lower()
             prt_name = MyRocksParser.partial_name(lc_var_name)
+            lc_variables.add(prt_name)
             if prt_name in valid_lc_variables:
                 valid_name = valid_lc_variables[prt_name].name
                 if prt_name != valid_name:
@@ -172,8 +180,6 @@ class MyRocksParser(BaseParser):
         # the given default_value if provided (or the item's actual default value
         # if not) and logged as 'missing'. For now missing local variables are
         # not added to valid_variables
-        lc_variables = {MyRocksParser.partial_name(k.lower()): v
-                        for k, v in list(variables.items())}
         for valid_lc_name, metadata in list(valid_lc_variables.items()):
             if valid_lc_name not in lc_variables:
                 diff_log.append(('missing', metadata.name, None, None))
@@ -182,52 +188,39 @@ class MyRocksParser(BaseParser):
                         default_value is not None else metadata.default
         return valid_variables, diff_log
 
-    def calculate_change_in_metrics(self, metrics_start, metrics_end):
-        adjusted_metrics = {}
-        for met_name, start_val in list(metrics_start.items()):
-            end_val = metrics_end[met_name]
-            met_info = self.metric_catalog_[MyRocksParser.partial_name(met_name)]
-            if met_info.vartype == VarType.INTEGER or \
-                    met_info.vartype == VarType.REAL:
-                conversion_fn = self.convert_integer if \
-                    met_info.vartype == VarType.INTEGER else \
-                    self.convert_real
-                start_val = conversion_fn(start_val, met_info)
-                end_val = conversion_fn(end_val, met_info)
-                adj_val = end_val - start_val
-                assert adj_val >= 0
-                adjusted_metrics[met_name] = adj_val
-            else:
-                # This metric is either a bool, enum, string, or timestamp
-                # so take last recorded value from metrics_end
-                adjusted_metrics[met_name] = end_val
-        return adjusted_metrics
+    def get_metric_metadata(self, name):
+        return self.metric_catalog_[MyRocksParser.partial_name(name)]
+
+    def get_numeric_metric_metadata(self, name):
+        return self.numeric_metric_catalog_.get(MyRocksParser.partial_name(name), None)
+
+    def is_delta_metric(self, metadata):  # pylint: disable=unused-argument
+        # All integer/real metrics are reported as their change
+        return True
 
     def parse_dbms_knobs(self, knobs):
         valid_knobs = self.parse_dbms_variables(knobs)
         # Extract all valid knobs
         return MyRocksParser.extract_valid_variables(
-            valid_knobs, self.knob_catalog_)
+            valid_knobs, self.knob_catalog_, lc_catalog=self.lc_knob_catalog_)
 
     def parse_dbms_metrics(self, metrics):
         valid_metrics = self.parse_dbms_variables(metrics)
         # Extract all valid metrics
         valid_metrics, diffs = MyRocksParser.extract_valid_variables(
-            valid_metrics, self.metric_catalog_, default_value='0')
+            valid_metrics, self.metric_catalog_, default_value='0',
+            lc_catalog=self.lc_metric_catalog_)
         return valid_metrics, diffs
 
     def convert_dbms_metrics(self, metrics, observation_time, target_objective=None):
-        metric_data = {}
-        for name, value in list(metrics.items()):
-            prt_name = MyRocksParser.partial_name(name)
-            if prt_name in self.numeric_metric_catalog_:
-                metadata = self.numeric_metric_catalog_[prt_name]
-                if metadata.metric_type == MetricType.COUNTER:
-                    converted = self.convert_integer(value, metadata)
-                    metric_data[name] = float(converted) / observation_time
-                else:
-                    raise Exception('Unknown metric type for {}: {}'.format(
-                        name, metadata.metric_type))
+        layout = self.get_metric_layout(list(metrics.keys()))
+        if not np.all(layout.numeric_counters):
+            index = np.flatnonzero(~layout.numeric_counters)[0]
+            raise Exception('Unknown metric type for {}: {}'.format(
+                layout.numeric_names[index], layout.numeric_metadata[index].metric_type))
+        metric_data = self.convert_numeric_metrics(
+            metrics, layout.numeric_names, layout.numeric_metadata,
+            layout.numeric_counters, observation_time)
 
         if target_objective is not None and self.target_metric(target_objective) not in metric_data:
             raise Exception("Cannot find objective function")
@@ -10,7 +10,10 @@ Created on Dec 12, 2017
 '''
 
 
-from website.models import DBMSCatalog
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from website.models import CacheVersion, DBMSCatalog, KnobCatalog, MetricCatalog
 from website.types import DBMSType
 
 from .myrocks import MyRocks56Parser
@@ -19,12 +22,20 @@ from .postgres import Postgres96Parser, PostgresOldParser
 
 class Parser(object):
 
-    __DBMS_UTILS_IMPLS = None
+    # The parsers are recreated whenever the version of the catalogs changes
+    # (see CacheVersion), including when they are changed by another process
+    CACHE_NAME = 'parser_catalogs'
+
+    # The version of the catalogs and the parsers created for it
+    __CACHED_UTILS = None
 
     @staticmethod
     def __utils(dbms_id=None):
-        if Parser.__DBMS_UTILS_IMPLS is None:
-            Parser.__DBMS_UTILS_IMPLS = {
+        version = CacheVersion.objects.get_checked_version(Parser.CACHE_NAME)
+        # The cache is read once since other threads may replace or clear it
+        cached_utils = Parser.__CACHED_UTILS
+        if cached_utils is None or cached_utils[0] != version:
+            cached_utils = (version, {
                 DBMSCatalog.objects.get(
                     type=DBMSType.POSTGRES, version='9.3').pk: PostgresOldParser('9.3'),
                 DBMSCatalog.objects.get(
@@ -37,15 +48,23 @@ class Parser(object):
                     type=DBMSType.POSTGRES, version='9.5').pk: Postgres96Parser('9.5'),
                 DBMSCatalog.objects.get(
                     type=DBMSType.MYROCKS, version='5.6').pk: MyRocks56Parser()
-            }
+            })
+            Parser.__CACHED_UTILS = cached_utils
+        dbms_utils_impls = cached_utils[1]
         try:
             if dbms_id is None:
-                return Parser.__DBMS_UTILS_IMPLS
-            return Parser.__DBMS_UTILS_IMPLS[dbms_id]
+                return dbms_utils_impls
+            return dbms_utils_impls[dbms_id]
         except KeyError:
             raise NotImplementedError(
                 'Implement me! ({})'.format(dbms_id))
 
+    @staticmethod
+    def clear_cache():
+        # The parsers precompile the knob/metric catalogs of their DBMS when
+        # they are created, so they are recreated after the catalogs change
+        Parser.__CACHED_UTILS = None
+
     @staticmethod
     def parse_version_string(dbms_type, version_string):
         for k, v in list(Parser.__utils(dbms_type).items()):
@@ -102,3 +121,10 @@ class Parser(object):
     def calculate_change_in_metrics(dbms_id, metrics_start, metrics_end):
         return Parser.__utils(dbms_id).calculate_change_in_metrics(
             metrics_start, metrics_end)
+
+
+@receiver([post_save, post_delete], sender=KnobCatalog)
+@receiver([post_save, post_delete], sender=MetricCatalog)
+def clear_parser_cache(sender, **kwargs):  # pylint: disable=unused-argument
+    CacheVersion.objects.bump_version(Parser.CACHE_NAME)
+    Parser.clear_cache()
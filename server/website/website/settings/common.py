@@ -13,6 +13,7 @@ from os.path import abspath, dirname, exists, join
 import sys
 
 import djcelery
+from kombu import Queue
 
 # ==============================================
 # PATH CONFIGURATION
@@ -37,6 +38,11 @@ LOG_DIR = join(PROJECT_ROOT, 'log')
 FILE_UPLOAD_DIRECTORY_PERMISSIONS = 0o664
 FILE_UPLOAD_PERMISSIONS = 0o664
 
+# Stream uploaded files to temporary files instead of holding them in memory
+FILE_UPLOAD_HANDLERS = (
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+)
+
 # Path to OtterTune's website and ML modules
 OTTERTUNE_LIBS = dirname(PROJECT_ROOT)
 
@@ -200,6 +206,28 @@ INSTALLED_APPS = (
     'website',
 )
 
+# ==============================================
+# CACHE CONFIGURATION
+# ==============================================
+
+# The 'dashboard' cache holds the data computed by the session dashboard
+# views. Its keys include the session's last update so uploading a new
+# result invalidates the cached data of the session. Override it (e.g., with
+# a memcached backend) in credentials.py to share it between processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
 # ==============================================
 # RABBITMQ/CELERY CONFIGURATION
 # ==============================================
@@ -218,6 +246,29 @@ CELERYD_MAX_TASKS_PER_CHILD = 50
 # Number of concurrent workers.
 CELERYD_CONCURRENCY = 8
 
+# The tasks that recommend the next configuration of an uploaded result and
+# the (long) background pipeline tasks are sent to separate queues so that a
+# pipeline run does not delay the recommendations of the tuning sessions.
+# Each queue is consumed by its own worker (see start_celery in the fabfile).
+CELERY_DEFAULT_QUEUE = 'default'
+CELERY_TUNER_QUEUE = 'tuner'
+CELERY_BACKGROUND_QUEUE = 'background'
+
+CELERY_QUEUES = (
+    Queue(CELERY_DEFAULT_QUEUE),
+    Queue(CELERY_TUNER_QUEUE),
+    Queue(CELERY_BACKGROUND_QUEUE),
+)
+
+CELERY_ROUTES = {
+    'ingest_result': {'queue': CELERY_TUNER_QUEUE},
+    'aggregate_target_results': {'queue': CELERY_TUNER_QUEUE},
+    'map_workload': {'queue': CELERY_TUNER_QUEUE},
+    'configuration_recommendation': {'queue': CELERY_TUNER_QUEUE},
+    'recommend_configuration': {'queue': CELERY_TUNER_QUEUE},
+    'run_background_tasks': {'queue': CELERY_BACKGROUND_QUEUE},
+}
+
 djcelery.setup_loader()
 
 # ==============================================
@@ -14,6 +14,41 @@ IMPORTANT_KNOB_NUMBER = 10
 #  top K config with best performance put into prediction
 TOP_NUM_CONFIG = 10
 
+#  stop computing the lasso path during knob identification as soon as
+#  enough knobs have entered it to rank the top IMPORTANT_KNOB_NUMBER knobs.
+#  The remaining knobs are then tied for the last rank.
+TRUNCATE_LASSO_PATH = False
+
+#  number of processes used to compute the lasso paths during knob
+#  identification. If not 1, a separate path is computed for each metric.
+LASSO_PATH_NUM_JOBS = 1
+
+#  run the aggregation, workload mapping and recommendation steps of a
+#  result in a single task, passing their data in memory instead of through
+#  the result backend. The status of each step is still saved separately.
+SINGLE_TASK_RECOMMENDATION = False
+
+# ---UPLOAD CONSTANTS---
+#  only save the uploaded result files in the new_result view and parse and
+#  store them in the first task of the tuning chain instead
+ASYNC_RESULT_INGESTION = False
+
+#  number of results parsed and inserted at once by the new_results_batch view
+RESULT_BATCH_SIZE = 100
+#  longest time (in seconds) a query_and_get request can wait for the
+#  recommendation of the latest result, and how often it checks its tasks
+RESULT_WAIT_TIMEOUT = 60
+RESULT_WAIT_INTERVAL = 0.5
+
+# ---CACHE CONSTANTS---
+#  how often (in seconds) each process checks whether the data it caches in
+#  memory (e.g., the knob catalog and its parsers) was changed by another one
+CACHE_VERSION_CHECK_INTERVAL = 5
+
+# ---DASHBOARD CONSTANTS---
+#  maximum number of results listed by a page of the session timeline
+TIMELINE_PAGE_SIZE = 1000
+
 # ---CONSTRAINTS CONSTANTS---
 
 #  Initial probability to flip categorical feature in apply_constraints
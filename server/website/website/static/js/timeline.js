@@ -5,7 +5,8 @@ var readCheckbox = window.readCheckbox, getLoadText = window.getLoadText, valueO
 
 var baselineColor = "#d8b83f",
     seriesColors = ["#4bb2c5", "#EAA228", "#579575", "#953579", "#839557", "#ff5800", "#958c12", "#4b5de4", "#0085cc"],
-    defaults;
+    defaults,
+    timeline_request = 0;
 
 function shouldPlotEquidistant() {
     return $("#equidistant").is(':checked');
@@ -169,9 +170,33 @@ function render(data) {
 
 function refreshContent() {
     var h = $("#content").height();//get height for loading text
+    var config = getConfiguration();
+    var request = ++timeline_request;
     $("#plotgrid").fadeOut("fast", function() {
         $("#plotgrid").html(getLoadText("Loading...", h, true)).show();
-        $.getJSON("/get_data/", getConfiguration(), render);
+        $.getJSON("/get_data/", config, function(data) {
+            if (request !== timeline_request) {
+                return;
+            }
+            render(data);
+            loadMoreResults(config, request, data.next_cursor);
+        });
+    });
+}
+
+// The results are sent one page at a time. Appends the next pages of
+// results to the table until all of them are listed (or the content is
+// refreshed).
+function loadMoreResults(config, request, cursor) {
+    if (cursor === null || cursor === undefined) {
+        return;
+    }
+    $.getJSON("/get_data/", $.extend({}, config, {cursor: cursor}), function(data) {
+        if (request !== timeline_request || data.error !== "None") {
+            return;
+        }
+        $("#dataTable").dataTable().fnAddData(data.results);
+        loadMoreResults(config, request, data.next_cursor);
     });
 }
 
@@ -4,8 +4,14 @@
 # Copyright (c) 2017-18, Carnegie Mellon University Database Group
 #
 from .async_tasks import (aggregate_target_results,
+                          check_result_summary,
                           configuration_recommendation,
-                          map_workload)
+                          ingest_result,
+                          map_workload,
+                          parse_result_files,
+                          recommend_configuration,
+                          store_result_batch,
+                          store_result_files)
 
 
 from .periodic_tasks import (run_background_tasks)
@@ -4,22 +4,35 @@
 # Copyright (c) 2017-18, Carnegie Mellon University Database Group
 #
 import random
+import re
 import queue
-import numpy as np
+import traceback
+import zlib
+from io import BytesIO
 
+import numpy as np
+from celery import states
+from celery.exceptions import Ignore, TaskRevokedError
+from celery.signals import task_revoked
 from celery.task import task, Task
 from celery.utils.log import get_task_logger
+from django.db.models import Q
+from django.utils.datetime_safe import datetime
+from django.utils.timezone import now
 from djcelery.models import TaskMeta
+from pytz import timezone
 from sklearn.preprocessing import StandardScaler
 
 from analysis.gp import GPRNP
 from analysis.gp_tf import GPRGD
-from analysis.preprocessing import Bin, DummyEncoder
+from analysis.preprocessing import Bin, DummyEncoder, get_rows_in
 from analysis.constraints import ParamConstraintHelper
-from website.models import PipelineData, PipelineRun, Result, Workload, KnobCatalog, MetricCatalog
+from website.models import (BackupData, DBMSCatalog, KnobCatalog, KnobData, LabelSchema,
+                            MetricCatalog, MetricData, PipelineData, PipelineRun,
+                            Project, Result, ResultIngestion, Session, Workload)
 from website.parser import Parser
-from website.types import PipelineTaskType
-from website.utils import DataUtil, JSONUtil
+from website.types import DBMSType, KnobResourceType, PipelineTaskType
+from website.utils import DataUtil, JSONUtil, TaskUtil
 from website.settings import IMPORTANT_KNOB_NUMBER, NUM_SAMPLES, TOP_NUM_CONFIG  # pylint: disable=no-name-in-module
 from website.settings import (DEFAULT_LENGTH_SCALE, DEFAULT_MAGNITUDE,
                               MAX_TRAIN_SIZE, BATCH_SIZE, NUM_THREADS,
@@ -27,6 +40,7 @@ from website.settings import (DEFAULT_LENGTH_SCALE, DEFAULT_MAGNITUDE,
                               DEFAULT_EPSILON, MAX_ITER, GPR_EPS,
                               DEFAULT_SIGMA_MULTIPLIER, DEFAULT_MU_MULTIPLIER)
 from website.settings import INIT_FLIP_PROB, FLIP_PROB_DECAY
+from website.settings import TIME_ZONE
 from website.types import VarType
 
 LOG = get_task_logger(__name__)
@@ -40,7 +54,23 @@ class UpdateTask(Task):  # pylint: disable=abstract-method
         self.default_retry_delay = 60
 
 
-class AggregateTargetResults(UpdateTask):  # pylint: disable=abstract-method
+class TunerTask(UpdateTask):  # pylint: disable=abstract-method
+
+    @staticmethod
+    def get_result_id(args):
+        # The first tuner task is passed the id of the result and the next
+        # ones the data of the previous task
+        if isinstance(args[0], dict):
+            return args[0]['newest_result_id']
+        return args[0]
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        super(TunerTask, self).on_failure(exc, task_id, args, kwargs, einfo)
+        fail_superseded_results(self.get_result_id(args), exc, states.FAILURE,
+                                einfo and einfo.traceback)
+
+
+class AggregateTargetResults(TunerTask):  # pylint: disable=abstract-method
 
     def on_success(self, retval, task_id, args, kwargs):
         super(AggregateTargetResults, self).on_success(retval, task_id, args, kwargs)
@@ -52,50 +82,393 @@ class AggregateTargetResults(UpdateTask):  # pylint: disable=abstract-method
         task_meta.save()
 
 
-class MapWorkload(UpdateTask):  # pylint: disable=abstract-method
+class MapWorkload(TunerTask):  # pylint: disable=abstract-method
 
     def on_success(self, retval, task_id, args, kwargs):
         super(MapWorkload, self).on_success(retval, task_id, args, kwargs)
 
         # Replace result with formatted result
-        if not args[0]['bad']:
-            new_res = {
-                'scores': sorted(args[0]['scores'].items()),
-                'mapped_workload_id': args[0]['mapped_workload'],
-            }
-            task_meta = TaskMeta.objects.get(task_id=task_id)
-            task_meta.result = new_res  # Only store scores
-            task_meta.save()
-        else:
-            task_meta = TaskMeta.objects.get(task_id=task_id)
-            task_meta.result = None
-            task_meta.save()
+        task_meta = TaskMeta.objects.get(task_id=task_id)
+        task_meta.result = format_workload_mapping(args[0])
+        task_meta.save()
 
 
-class ConfigurationRecommendation(UpdateTask):  # pylint: disable=abstract-method
+class ConfigurationRecommendation(TunerTask):  # pylint: disable=abstract-method
 
     def on_success(self, retval, task_id, args, kwargs):
         super(ConfigurationRecommendation, self).on_success(retval, task_id, args, kwargs)
 
-        result_id = args[0]['newest_result_id']
-        result = Result.objects.get(pk=result_id)
-
         # Replace result with formatted result
-        formatted_params = Parser.format_dbms_knobs(result.dbms.pk, retval['recommendation'])
         task_meta = TaskMeta.objects.get(task_id=task_id)
-        retval['recommendation'] = formatted_params
-        task_meta.result = retval
+        task_meta.result = save_recommendation(args[0]['newest_result_id'], retval)
         task_meta.save()
 
-        # Create next configuration to try
-        config = Parser.create_knob_configuration(result.dbms.pk, retval['recommendation'])
-        retval['recommendation'] = config
-        result.next_configuration = JSONUtil.dumps(retval)
+
+def format_workload_mapping(target_data):
+    # Only the scores of the workload mapping are kept as its task result
+    if target_data['bad']:
+        return None
+    return {
+        'scores': sorted(target_data['scores'].items()),
+        'mapped_workload_id': target_data['mapped_workload'],
+    }
+
+
+def save_recommendation(result_id, retval):
+    # Saves the next configuration to try in the result and returns the
+    # formatted recommendation kept as the task result
+    result = Result.objects.get(pk=result_id)
+    formatted_params = Parser.format_dbms_knobs(result.dbms.pk, retval['recommendation'])
+    retval['recommendation'] = formatted_params
+    task_result = dict(retval)
+
+    # Create next configuration to try
+    config = Parser.create_knob_configuration(result.dbms.pk, retval['recommendation'])
+    retval['recommendation'] = config
+    result.next_configuration = JSONUtil.dumps(retval)
+    result.save()
+
+    # The recommendation is also the one for the older results of the session
+    # whose tuner tasks were skipped
+    coalesce_recommendation(result, task_result, get_superseded_results(result))
+    return task_result
+
+
+def check_result_summary(session, summary):
+    # Checks that the result described by the controller's summary can be
+    # stored in the session. Returns the result's DBMS and an error message
+    # (None if the result is valid).
+    dbms_type = DBMSType.type(summary['database_type'])
+    dbms_version = summary['database_version']  # TODO: fix parse_version_string
+    workload_name = summary['workload_name']
+
+    # Check if workload name only contains alpha-numeric, underscore and hyphen
+    if not re.match('^[a-zA-Z0-9_-]+$', workload_name):
+        return None, ('Your workload name ' + workload_name + ' contains '
+                      'invalid characters! It should only contain '
+                      'alpha-numeric, underscore(_) and hyphen(-)')
+
+    try:
+        # Check that we support this DBMS and version
+        dbms = DBMSCatalog.objects.get(
+            type=dbms_type, version=dbms_version)
+    except DBMSCatalog.DoesNotExist:
+        return None, '{} v{} is not yet supported.'.format(
+            dbms_type, dbms_version)
+
+    if dbms != session.dbms:
+        return None, ('The DBMS must match the type and version '
+                      'specified when creating the session. '
+                      '(expected=' + session.dbms.full_name + ') '
+                      '(actual=' + dbms.full_name + ')')
+    return dbms, None
+
+
+def parse_result_files(session, dbms, summary, files):
+    # Parses the knob and metric files uploaded by the controller
+    observation_time = summary['observation_time']
+    start_time = datetime.fromtimestamp(
+        # int(summary['start_time']), # unit: seconds
+        int(summary['start_time']) / 1000,  # unit: ms
+        timezone(TIME_ZONE))
+    end_time = datetime.fromtimestamp(
+        # int(summary['end_time']), # unit: seconds
+        int(summary['end_time']) / 1000,  # unit: ms
+        timezone(TIME_ZONE))
+
+    # Load and process the knobs in the DBMS's configuration
+    knob_dict, knob_diffs = Parser.parse_dbms_knobs(
+        dbms.pk, JSONUtil.load(files['knobs']))
+    tunable_knob_dict = Parser.convert_dbms_knobs(
+        dbms.pk, knob_dict)
+
+    # Load and process the runtime metrics exposed by the DBMS
+    initial_metric_dict, initial_metric_diffs = Parser.parse_dbms_metrics(
+        dbms.pk, JSONUtil.load(files['metrics_before']))
+    final_metric_dict, final_metric_diffs = Parser.parse_dbms_metrics(
+        dbms.pk, JSONUtil.load(files['metrics_after']))
+    metric_dict = Parser.calculate_change_in_metrics(
+        dbms.pk, initial_metric_dict, final_metric_dict)
+    initial_metric_diffs.extend(final_metric_diffs)
+    numeric_metric_dict = Parser.convert_dbms_metrics(
+        dbms.pk, metric_dict, observation_time, session.target_objective)
+
+    return {
+        'workload_name': summary['workload_name'],
+        'observation_time': observation_time,
+        'start_time': start_time,
+        'end_time': end_time,
+        'knob_dict': knob_dict,
+        'knobs': JSONUtil.dumps(knob_dict, pprint=True, sort=True),
+        'knob_data': JSONUtil.dumps(tunable_knob_dict, pprint=True, sort=True),
+        'knob_log': knob_diffs,
+        'metrics': JSONUtil.dumps(metric_dict, pprint=True, sort=True),
+        'metric_data': JSONUtil.dumps(numeric_metric_dict, pprint=True, sort=True),
+        'metric_log': initial_metric_diffs,
+    }
+
+
+def update_session(session, dbms, knob_dict, latest_result):
+    nondefault_settings = Parser.get_nondefault_knob_settings(
+        dbms.pk, knob_dict)
+    # Concurrent uploads to the session may be stored at the same time so
+    # only the updated fields are saved. The latest result pointer is only
+    # moved forward.
+    last_update = now()
+    Project.objects.filter(pk=session.project_id).update(last_update=last_update)
+    sessions = Session.objects.filter(pk=session.pk)
+    sessions.update(last_update=last_update)
+    sessions.filter(Q(latest_result__isnull=True) | Q(latest_result_id__lt=latest_result.pk)) \
+        .update(latest_result=latest_result)
+    sessions.filter(nondefault_settings__isnull=True).update(
+        nondefault_settings=JSONUtil.dumps(nondefault_settings))
+    session.refresh_from_db(fields=['last_update', 'latest_result', 'nondefault_settings'])
+
+
+def store_result_files(session, dbms, summary, files, raw_files):
+    # Parses the files uploaded by the controller and stores them as a new
+    # result of the session (files are file objects and raw_files their
+    # compressed contents)
+    parsed = parse_result_files(session, dbms, summary, files)
+
+    # Store the knobs and the metrics
+    knob_data = KnobData.objects.create_knob_data(
+        session, parsed['knobs'], parsed['knob_data'], dbms)
+    metric_data = MetricData.objects.create_metric_data(
+        session, parsed['metrics'], parsed['metric_data'], dbms)
+
+    # Create a new workload if this one does not already exist
+    workload = Workload.objects.create_workload(
+        dbms, session.hardware, parsed['workload_name'])
+
+    # Save this result
+    result = Result.objects.create_result(
+        session, dbms, workload, knob_data, metric_data,
+        parsed['start_time'], parsed['end_time'], parsed['observation_time'])
+    result.save()
+
+    # Save all original data
+    BackupData.objects.create_backup_data(
+        result, raw_files, knob_log=parsed['knob_log'], metric_log=parsed['metric_log'])
+
+    update_session(session, dbms, parsed['knob_dict'], result)
+    return result
+
+
+def store_result_batch(session, dbms, parsed_results):
+    # Stores many parsed results of the session (each with the compressed
+    # contents of its files as 'raw_files') using bulk inserts. Returns the
+    # new results.
+    creation_time = now()
+
+    # Reuse the knob data of the session with the same knobs
+    knob_datas = {}
+    for parsed in parsed_results:
+        knob_datas[parsed['knobs']] = None
+    knob_datas.update({k.knobs: k for k in KnobData.objects.filter(
+        session=session, knobs__in=list(knob_datas.keys()))})
+    new_knob_datas = []
+    for parsed in parsed_results:
+        if knob_datas[parsed['knobs']] is None:
+            knob_data = KnobData(session=session, knobs=parsed['knobs'],
+                                 data=parsed['knob_data'], dbms=dbms,
+                                 creation_time=creation_time)
+            knob_data.update_vector()
+            knob_datas[parsed['knobs']] = knob_data
+            new_knob_datas.append(knob_data)
+    KnobData.objects.bulk_create_data(session, dbms, new_knob_datas)
+
+    metric_datas = []
+    for parsed in parsed_results:
+        metric_data = MetricData(session=session, metrics=parsed['metrics'],
+                                 data=parsed['metric_data'], dbms=dbms,
+                                 creation_time=creation_time)
+        metric_data.update_vector()
+        metric_datas.append(metric_data)
+    MetricData.objects.bulk_create_data(session, dbms, metric_datas)
+
+    workloads = {}
+    results = []
+    for parsed, metric_data in zip(parsed_results, metric_datas):
+        workload_name = parsed['workload_name']
+        if workload_name not in workloads:
+            workloads[workload_name] = Workload.objects.create_workload(
+                dbms, session.hardware, workload_name)
+        results.append(Result(session=session, dbms=dbms,
+                              workload=workloads[workload_name],
+                              knob_data=knob_datas[parsed['knobs']],
+                              metric_data=metric_data,
+                              observation_start_time=parsed['start_time'],
+                              observation_end_time=parsed['end_time'],
+                              observation_time=parsed['observation_time'],
+                              creation_time=creation_time))
+    Result.objects.bulk_create_results(session, results)
+
+    BackupData.objects.bulk_create([
+        BackupData(result=result, knob_log=parsed['knob_log'],
+                   metric_log=parsed['metric_log'],
+                   **{field: parsed['raw_files'][name]
+                      for name, field in BackupData.RAW_FIELDS.items()})
+        for parsed, result in zip(parsed_results, results)])
+
+    update_session(session, dbms, parsed_results[0]['knob_dict'],
+                   max(results, key=lambda r: r.pk))
+    return results
+
+
+@task(base=UpdateTask, name='ingest_result')
+def ingest_result(ingestion_id):
+    # Parses and stores the result files saved by the new_result view. The
+    # ids of the tasks of the chain are saved with the ingestion, starting
+    # with this task's.
+    ingestion = ResultIngestion.objects.get(pk=ingestion_id)
+    session = ingestion.session
+    raw_files = ingestion.get_raw_files()
+    files = {name: BytesIO(zlib.decompress(data)) for name, data in raw_files.items()}
+
+    summary = JSONUtil.load(files['summary'])
+    dbms, error = check_result_summary(session, summary)
+    if error is not None:
+        raise Exception(error)
+    result = store_result_files(session, dbms, summary, files, raw_files)
+
+    tuner_task_ids = ingestion.task_ids.split(',')[1:]
+    if len(tuner_task_ids) > 0:
+        result.task_ids = ','.join(tuner_task_ids)
         result.save()
 
+    # The raw files are now saved in the result's backup data
+    ingestion.result = result
+    ingestion.clear_raw_files()
+    ingestion.save()
+    return result.pk
+
+
+def skip_superseded_tasks(result):
+    # Only the tuner tasks of the newest result of a session compute a
+    # recommendation. The tasks of the older results are skipped as soon as
+    # the tasks of a newer result are queued, and the recommendation for the
+    # newer result is saved for them once it is ready (see
+    # coalesce_recommendation).
+    if result.task_ids is None:
+        return False
+    task_ids = result.task_ids.split(',')
+    failed_task = TaskMeta.objects.filter(
+        task_id__in=task_ids, status__in=[states.FAILURE, states.REVOKED]).first()
+    if failed_task is not None:
+        # The tasks of the newer result failed before this task started (see
+        # fail_superseded_results). This task fails in the same way.
+        for task_meta in TaskMeta.objects.filter(task_id__in=task_ids, status=states.STARTED):
+            TaskMeta.objects.store_result(task_meta.task_id, failed_task.result,
+                                          failed_task.status, traceback=failed_task.traceback)
+        return True
+    if result.next_configuration is not None:
+        # The recommendation for a newer result was saved for this result
+        # (and its tasks completed) before this task started
+        for task_meta in TaskMeta.objects.filter(task_id__in=task_ids, status=states.STARTED):
+            TaskMeta.objects.store_result(task_meta.task_id, None, states.SUCCESS)
+        return True
+    newer_results = Result.objects.filter(
+        session=result.session_id, pk__gt=result.pk).exclude(task_ids=None)
+    if not newer_results.exists():
+        return False
+    LOG.info("Skipping the tuner tasks of result %s superseded by a newer result", result.pk)
+
+    # The skipped task is pending again until the recommendation is saved.
+    # The newest result is only checked afterwards so that either this task
+    # or the tasks of the newest result save the recommendation for this
+    # result.
+    TaskMeta.objects.filter(task_id__in=task_ids, status=states.STARTED).update(
+        status=states.PENDING)
+    newest_result = newer_results.order_by('-pk').first()
+    if newest_result.next_configuration is not None:
+        task_meta = TaskMeta.objects.filter(
+            task_id=newest_result.task_ids.split(',')[-1]).first()
+        coalesce_recommendation(newest_result, task_meta and task_meta.result, [result])
+    return True
+
+
+def get_superseded_results(result):
+    # Returns the older results of the session (uploaded since the last one
+    # with a recommendation) whose tuner tasks were skipped or have not
+    # started yet
+    older_results = Result.objects.filter(session=result.session_id, pk__lt=result.pk)
+    last_recommended_id = older_results.exclude(next_configuration=None).order_by(
+        '-pk').values_list('pk', flat=True).first()
+    if last_recommended_id is not None:
+        older_results = older_results.filter(pk__gt=last_recommended_id)
+    older_results = list(older_results.filter(next_configuration=None).exclude(
+        task_ids=None).only('pk', 'task_ids'))
+    if len(older_results) == 0:
+        return []
+
+    task_metas = {t.task_id: t for t in TaskMeta.objects.filter(task_id__in=[
+        task_id for older_result in older_results
+        for task_id in older_result.task_ids.split(',')])}
+    superseded_results = []
+    for older_result in older_results:
+        task_ids = older_result.task_ids.split(',')
+        tasks = [task_metas[task_id] for task_id in task_ids if task_id in task_metas]
+        status, num_completed = TaskUtil.get_task_status(tasks)
+        # The running and failed tasks are left alone
+        if status in (None, states.PENDING, states.SUCCESS) and num_completed < len(task_ids):
+            superseded_results.append(older_result)
+    return superseded_results
+
+
+def coalesce_recommendation(result, task_result, superseded_results):
+    # Saves the recommendation for the result for the superseded results and
+    # completes their tuner tasks
+    if len(superseded_results) == 0:
+        return
+    Result.objects.filter(pk__in=[r.pk for r in superseded_results]).update(
+        next_configuration=result.next_configuration)
+    if task_result is not None:
+        task_result = dict(task_result, coalesced_result_id=result.pk)
+
+    task_ids = [r.task_ids.split(',') for r in superseded_results]
+    completed_task_ids = set(TaskMeta.objects.filter(
+        task_id__in=[task_id for ids in task_ids for task_id in ids],
+        status=states.SUCCESS).values_list('task_id', flat=True))
+    for ids in task_ids:
+        for task_id in ids[:-1]:
+            if task_id not in completed_task_ids:
+                TaskMeta.objects.store_result(task_id, None, states.SUCCESS)
+        TaskMeta.objects.store_result(ids[-1], task_result, states.SUCCESS)
+    LOG.info("Saved the recommendation for result %s for the results %s", result.pk,
+             ', '.join(str(r.pk) for r in superseded_results))
+
+
+def fail_superseded_results(result_id, exc, status, traceback_str=None):
+    # The recommendation for the result will never be saved, so the tuner
+    # tasks of the results it superseded fail (or are revoked) as well
+    # instead of staying pending
+    superseded_results = get_superseded_results(Result.objects.get(pk=result_id))
+    if len(superseded_results) == 0:
+        return
+    task_ids = [task_id for r in superseded_results for task_id in r.task_ids.split(',')]
+    completed_task_ids = set(TaskMeta.objects.filter(
+        task_id__in=task_ids, status=states.SUCCESS).values_list('task_id', flat=True))
+    for task_id in task_ids:
+        if task_id not in completed_task_ids:
+            TaskMeta.objects.store_result(task_id, exc, status, traceback=traceback_str)
+    LOG.info("The tuner tasks of result %s failed, so did the ones of the results %s",
+             result_id, ', '.join(str(r.pk) for r in superseded_results))
+
+
+@task_revoked.connect
+def fail_revoked_results(sender=None, request=None, **kwargs):  # pylint: disable=unused-argument
+    if isinstance(sender, TunerTask):
+        fail_superseded_results(TunerTask.get_result_id(request.args),
+                                TaskRevokedError(request.id), states.REVOKED)
+
 
 @task(base=AggregateTargetResults, name='aggregate_target_results')
 def aggregate_target_results(result_id):
+    if skip_superseded_tasks(Result.objects.get(pk=result_id)):
+        # Stops the chain without saving the state of this task
+        raise Ignore()
+
     # Check that we've completed the background tasks at least once. We need
     # this data in order to make a configuration recommendation (until we
     # implement a sampling technique to generate new training data).
@@ -103,10 +476,7 @@ def aggregate_target_results(result_id):
     newest_result = Result.objects.get(pk=result_id)
     if latest_pipeline_run is None or newest_result.session.tuning_session == 'randomly_generate':
         result = Result.objects.filter(pk=result_id)
-        knobs_ = KnobCatalog.objects.filter(dbms=result[0].dbms, tunable=True)
-        knobs_catalog = {k.name: k for k in knobs_}
-        knobs = {k: v for k, v in
-                 list(knobs_catalog.items())}
+        knobs = KnobCatalog.objects.get_tunable_metadata(newest_result.dbms)
         # generate a config randomly
         random_knob_result = gen_random_data(knobs)
         agg_data = DataUtil.aggregate_data(result)
@@ -161,6 +531,9 @@ def gen_random_data(knobs):
 @task(base=ConfigurationRecommendation, name='configuration_recommendation')
 def configuration_recommendation(target_data):
     LOG.info('configuration_recommendation called')
+    if skip_superseded_tasks(Result.objects.get(pk=target_data['newest_result_id'])):
+        raise Ignore()
+
     latest_pipeline_run = PipelineRun.objects.get_latest()
 
     if target_data['bad'] is True:
@@ -178,12 +551,14 @@ def configuration_recommendation(target_data):
         pipeline_run=latest_pipeline_run,
         workload=mapped_workload,
         task_type=PipelineTaskType.KNOB_DATA)
-    workload_knob_data = JSONUtil.loads(workload_knob_data.data)
+    X_schema_id = workload_knob_data.schema_id
+    workload_knob_data = workload_knob_data.get_data()
     workload_metric_data = PipelineData.objects.get(
         pipeline_run=latest_pipeline_run,
         workload=mapped_workload,
         task_type=PipelineTaskType.METRIC_DATA)
-    workload_metric_data = JSONUtil.loads(workload_metric_data.data)
+    y_schema_id = workload_metric_data.schema_id
+    workload_metric_data = workload_metric_data.get_data()
 
     X_workload = np.array(workload_knob_data['data'])
     X_columnlabels = np.array(workload_knob_data['columnlabels'])
@@ -197,10 +572,14 @@ def configuration_recommendation(target_data):
     y_target = target_data['y_matrix']
     rowlabels_target = np.array(target_data['rowlabels'])
 
-    if not np.array_equal(X_columnlabels, target_data['X_columnlabels']):
+    if not LabelSchema.objects.labels_match(X_schema_id, X_columnlabels,
+                                            target_data['X_schema_id'],
+                                            target_data['X_columnlabels']):
         raise Exception(('The workload and target data should have '
                          'identical X columnlabels (sorted knob names)'))
-    if not np.array_equal(y_columnlabels, target_data['y_columnlabels']):
+    if not LabelSchema.objects.labels_match(y_schema_id, y_columnlabels,
+                                            target_data['y_schema_id'],
+                                            target_data['y_columnlabels']):
         raise Exception(('The workload and target data should have '
                          'identical y columnlabels (sorted metric names)'))
 
@@ -245,11 +624,7 @@ def configuration_recommendation(target_data):
 
     # Delete any rows that appear in both the workload data and the target
     # data from the workload data
-    dups_filter = np.ones(X_workload.shape[0], dtype=bool)
-    target_row_tups = [tuple(row) for row in X_target]
-    for i, row in enumerate(X_workload):
-        if tuple(row) in target_row_tups:
-            dups_filter[i] = False
+    dups_filter = ~get_rows_in(X_workload, X_target)
     X_workload = X_workload[dups_filter, :]
     y_workload = y_workload[dups_filter, :]
     rowlabels_workload = rowlabels_workload[dups_filter]
@@ -313,17 +688,16 @@ def configuration_recommendation(target_data):
     X_samples = np.empty((num_samples, X_scaled.shape[1]))
     X_min = np.empty(X_scaled.shape[1])
     X_max = np.empty(X_scaled.shape[1])
-    knobs_mem = KnobCatalog.objects.filter(
-        dbms=newest_result.session.dbms, tunable=True, resource=1)
-    knobs_mem_catalog = {k.name: k for k in knobs_mem}
+    knob_catalog = KnobCatalog.objects.get_metadata(newest_result.session.dbms)
+    knobs_mem_catalog = KnobCatalog.objects.get_tunable_metadata(
+        newest_result.session.dbms, resource=KnobResourceType.MEMORY)
     mem_max = newest_result.workload.hardware.memory
     X_mem = np.zeros([1, X_scaled.shape[1]])
     X_default = np.empty(X_scaled.shape[1])
 
     # Get default knob values
     for i, k_name in enumerate(X_columnlabels):
-        k = KnobCatalog.objects.filter(dbms=newest_result.session.dbms, name=k_name)[0]
-        X_default[i] = k.default
+        X_default[i] = knob_catalog[k_name].default
 
     X_default_scaled = X_scaler.transform(X_default.reshape(1, X_default.shape[0]))[0]
 
@@ -411,15 +785,54 @@ def configuration_recommendation(target_data):
     return conf_map_res
 
 
+@task(base=TunerTask, name='recommend_configuration', ignore_result=True)
+def recommend_configuration(result_id, stage_task_ids):
+    # Runs the aggregation, workload mapping and recommendation steps of the
+    # result in this process. The (large) data of each step is passed on in
+    # memory and only the formatted result of each step is saved, under the
+    # task ids in stage_task_ids, so the status of the steps is reported as
+    # if they were run by a chain of tasks.
+    if skip_superseded_tasks(Result.objects.get(pk=result_id)):
+        raise Ignore()
+
+    stages = [
+        (aggregate_target_results, lambda _: None),
+        (map_workload, format_workload_mapping),
+        (configuration_recommendation,
+         lambda data: save_recommendation(result_id, data)),
+    ]
+    for stage_task_id in stage_task_ids:
+        TaskMeta.objects.store_result(stage_task_id, None, states.PENDING)
+
+    data = result_id
+    for (stage, format_result), stage_task_id in zip(stages, stage_task_ids):
+        TaskMeta.objects.store_result(stage_task_id, None, states.STARTED)
+        try:
+            data = stage.run(data)
+            stage_result = format_result(data)
+        except Ignore:
+            # The result was superseded (see skip_superseded_tasks)
+            raise
+        except Exception as ex:
+            TaskMeta.objects.store_result(stage_task_id, ex, states.FAILURE,
+                                          traceback=traceback.format_exc())
+            raise
+        TaskMeta.objects.store_result(stage_task_id, stage_result, states.SUCCESS)
+    return result_id
+
+
 def load_data_helper(filtered_pipeline_data, workload, task_type):
     pipeline_data = filtered_pipeline_data.get(workload=workload,
                                                task_type=task_type)
     LOG.debug("PIPELINE DATA: %s", str(pipeline_data.data))
-    return JSONUtil.loads(pipeline_data.data)
+    return pipeline_data.get_data()
 
 
 @task(base=MapWorkload, name='map_workload')
 def map_workload(target_data):
+    if skip_superseded_tasks(Result.objects.get(pk=target_data['newest_result_id'])):
+        raise Ignore()
+
     # Get the latest version of pipeline data that's been computed so far.
     latest_pipeline_run = PipelineRun.objects.get_latest()
     if target_data['bad']:
@@ -16,8 +16,11 @@ from analysis.factor_analysis import FactorAnalysis
 from analysis.lasso import LassoPath
 from analysis.preprocessing import (Bin, get_shuffle_indices,
                                     DummyEncoder,
-                                    consolidate_columnlabels)
+                                    consolidate_columnlabels,
+                                    get_nonconstant_columns)
 from website.models import PipelineData, PipelineRun, Result, Workload
+from website.settings import (IMPORTANT_KNOB_NUMBER,  # pylint: disable=no-name-in-module
+                              LASSO_PATH_NUM_JOBS, TRUNCATE_LASSO_PATH)
 from website.types import PipelineTaskType
 from website.utils import DataUtil, JSONUtil
 
@@ -56,21 +59,31 @@ def run_background_tasks():
         # objects.
         knob_data_copy = copy.deepcopy(knob_data)
         knob_data_copy['data'] = knob_data_copy['data'].tolist()
+        knob_schema_id = knob_data_copy.pop('schema_id')
+        if knob_schema_id is not None:
+            # The column labels are already stored in the label schema
+            del knob_data_copy['columnlabels']
         knob_data_copy = JSONUtil.dumps(knob_data_copy)
         knob_entry = PipelineData(pipeline_run=pipeline_run_obj,
                                   task_type=PipelineTaskType.KNOB_DATA,
                                   workload=workload,
                                   data=knob_data_copy,
+                                  schema_id=knob_schema_id,
                                   creation_time=now())
         knob_entry.save()
 
         metric_data_copy = copy.deepcopy(metric_data)
         metric_data_copy['data'] = metric_data_copy['data'].tolist()
+        metric_schema_id = metric_data_copy.pop('schema_id')
+        if metric_schema_id is not None:
+            # The column labels are already stored in the label schema
+            del metric_data_copy['columnlabels']
         metric_data_copy = JSONUtil.dumps(metric_data_copy)
         metric_entry = PipelineData(pipeline_run=pipeline_run_obj,
                                     task_type=PipelineTaskType.METRIC_DATA,
                                     workload=workload,
                                     data=metric_data_copy,
+                                    schema_id=metric_schema_id,
                                     creation_time=now())
         metric_entry.save()
 
@@ -135,6 +148,8 @@ def aggregate_data(wkld_results):
     #         columns in the knob_data matrix
     #   - 'y_columnlabels': a list of the metric names corresponding to the
     #         columns in the metric_data matrix
+    #   - 'X_schema_id'/'y_schema_id': the ids of the label schemas of the
+    #         knob/metric names (None for data saved without a schema)
     aggregated_data = DataUtil.aggregate_data(wkld_results)
 
     # Separate knob & workload data into two "standard" dictionaries of the
@@ -142,13 +157,15 @@ def aggregate_data(wkld_results):
     knob_data = {
         'data': aggregated_data['X_matrix'],
         'rowlabels': aggregated_data['rowlabels'],
-        'columnlabels': aggregated_data['X_columnlabels']
+        'columnlabels': aggregated_data['X_columnlabels'],
+        'schema_id': aggregated_data['X_schema_id'],
     }
 
     metric_data = {
         'data': aggregated_data['y_matrix'],
         'rowlabels': copy.deepcopy(aggregated_data['rowlabels']),
-        'columnlabels': aggregated_data['y_columnlabels']
+        'columnlabels': aggregated_data['y_columnlabels'],
+        'schema_id': aggregated_data['y_schema_id'],
     }
 
     # Return the knob & metric data
@@ -170,14 +187,11 @@ def run_workload_characterization(metric_data):
     columnlabels = metric_data['columnlabels']
 
     # Remove any constant columns
-    nonconst_matrix = []
-    nonconst_columnlabels = []
-    for col, cl in zip(matrix.T, columnlabels):
-        if np.any(col != col[0]):
-            nonconst_matrix.append(col.reshape(-1, 1))
-            nonconst_columnlabels.append(cl)
-    assert len(nonconst_matrix) > 0, "Need more data to train the model"
-    nonconst_matrix = np.hstack(nonconst_matrix)
+    nonconst_mask = get_nonconstant_columns(matrix)
+    assert np.any(nonconst_mask), "Need more data to train the model"
+    nonconst_matrix = matrix[:, nonconst_mask]
+    nonconst_columnlabels = [cl for cl, nonconst in zip(columnlabels, nonconst_mask)
+                             if nonconst]
     n_rows, n_cols = nonconst_matrix.shape
 
     # Bin each column (metric) in the matrix by its decile
@@ -235,27 +249,16 @@ def run_knob_identification(knob_data, metric_data, dbms):
     knob_columnlabels = knob_data['columnlabels']
 
     metric_matrix = metric_data['data']
-    metric_columnlabels = metric_data['columnlabels']
 
     # remove constant columns from knob_matrix and metric_matrix
-    nonconst_knob_matrix = []
-    nonconst_knob_columnlabels = []
+    nonconst_knob_mask = get_nonconstant_columns(knob_matrix)
+    assert np.any(nonconst_knob_mask), "Need more data to train the model"
+    nonconst_knob_matrix = knob_matrix[:, nonconst_knob_mask]
+    nonconst_knob_columnlabels = [cl for cl, nonconst in
+                                  zip(knob_columnlabels, nonconst_knob_mask) if nonconst]
 
-    for col, cl in zip(knob_matrix.T, knob_columnlabels):
-        if np.any(col != col[0]):
-            nonconst_knob_matrix.append(col.reshape(-1, 1))
-            nonconst_knob_columnlabels.append(cl)
-    assert len(nonconst_knob_matrix) > 0, "Need more data to train the model"
-    nonconst_knob_matrix = np.hstack(nonconst_knob_matrix)
-
-    nonconst_metric_matrix = []
-    nonconst_metric_columnlabels = []
-
-    for col, cl in zip(metric_matrix.T, metric_columnlabels):
-        if np.any(col != col[0]):
-            nonconst_metric_matrix.append(col.reshape(-1, 1))
-            nonconst_metric_columnlabels.append(cl)
-    nonconst_metric_matrix = np.hstack(nonconst_metric_matrix)
+    nonconst_metric_mask = get_nonconstant_columns(metric_matrix)
+    nonconst_metric_matrix = metric_matrix[:, nonconst_metric_mask]
 
     # determine which knobs need encoding (enums with >2 possible values)
 
@@ -281,8 +284,16 @@ def run_knob_identification(knob_data, metric_data, dbms):
     shuffled_metric_matrix = standardized_metric_matrix[shuffle_indices, :]
 
     # run lasso algorithm
+    if TRUNCATE_LASSO_PATH:
+        # Each categorical knob is split into several dummy features so
+        # this many features must enter the path to guarantee that at least
+        # IMPORTANT_KNOB_NUMBER distinct knobs have entered it
+        max_features = IMPORTANT_KNOB_NUMBER + dummy_encoder.total_dummies()
+    else:
+        max_features = None
     lasso_model = LassoPath()
-    lasso_model.fit(shuffled_knob_matrix, shuffled_metric_matrix, encoded_knob_columnlabels)
+    lasso_model.fit(shuffled_knob_matrix, shuffled_metric_matrix, encoded_knob_columnlabels,
+                    max_features=max_features, n_jobs=LASSO_PATH_NUM_JOBS)
 
     # consolidate categorical feature columns, and reset to original names
     encoded_knobs = lasso_model.get_ranked_features()
@@ -39,6 +39,7 @@ urlpatterns = [
 
     # URLs for result views
     url(r'^new_result/', website_views.new_result, name='new_result'),
+    url(r'^new_results_batch/', website_views.new_results_batch, name='new_results_batch'),
     url(r'^projects/(?P<project_id>[0-9]+)/sessions/(?P<session_id>[0-9]+)/results/(?P<result_id>[0-9]+)/$', website_views.result_view, name='result'),
     url(r'^projects/(?P<project_id>[0-9]+)/sessions/(?P<session_id>[0-9]+)/workloads/(?P<wkld_id>[0-9]+)/$', website_views.workload_view, name='workload'),
     url(r'^projects/(?P<project_id>[0-9]+)/sessions/(?P<session_id>[0-9]+)/knobs/(?P<data_id>[0-9]+)/$', website_views.knob_data_view, name='knob_data'),
@@ -64,6 +65,7 @@ urlpatterns = [
 
     # Back door
     url(r'^query_and_get/(?P<upload_code>[0-9a-zA-Z]+)$', website_views.give_result, name="backdoor"),
+    url(r'^queue_status/$', website_views.queue_status, name="queue_status"),
 ]
 
 if settings.DEBUG:
@@ -9,6 +9,8 @@ Created on Jul 8, 2017
 @author: dvanaken
 '''
 
+import codecs
+import hashlib
 import json
 import logging
 import string
@@ -16,11 +18,13 @@ from collections import OrderedDict
 from random import choice
 
 import numpy as np
+from django.core.cache import caches
+from django.db.models import Case, F, TextField, Value, When
 from django.utils.text import capfirst
 from djcelery.models import TaskMeta
 
 from .types import LabelStyleType, VarType
-from .models import KnobCatalog, DBMSCatalog
+from .models import DataModel, KnobCatalog, LabelSchema
 
 LOG = logging.getLogger(__name__)
 
@@ -33,6 +37,12 @@ class JSONUtil(object):
                           encoding="UTF-8",
                           object_pairs_hook=OrderedDict)
 
+    @staticmethod
+    def load(config_file):
+        # Decodes the file as it is read instead of loading its contents first
+        return json.load(codecs.getreader('utf-8')(config_file),
+                         object_pairs_hook=OrderedDict)
+
     @staticmethod
     def dumps(config, pprint=False, sort=False):
         indent = 4 if pprint is True else None
@@ -63,13 +73,9 @@ class TaskUtil(object):
         if not tasks:
             return []
         task_ids = tasks.split(',')
-        res = []
-        for task_id in task_ids:
-            task = TaskMeta.objects.filter(task_id=task_id)
-            if len(task) == 0:
-                continue  # Task Not Finished
-            res.append(task[0])
-        return res
+        task_metas = {t.task_id: t for t in TaskMeta.objects.filter(task_id__in=task_ids)}
+        # Tasks that have not finished have no TaskMeta yet
+        return [task_metas[task_id] for task_id in task_ids if task_id in task_metas]
 
     @staticmethod
     def get_task_status(tasks):
@@ -89,48 +95,131 @@ class TaskUtil(object):
                 overall_status = status
         return overall_status, num_completed
 
+    @staticmethod
+    def get_queue_status():
+        # Returns the number of queued tasks and of consumers (workers) of
+        # each celery queue. The queues are declared passively so that they
+        # are never created here; a queue that does not exist yet has neither
+        # tasks nor consumers.
+        from celery import current_app
+        queue_status = OrderedDict()
+        with current_app.connection() as conn:
+            for queue in current_app.amqp.queues.values():
+                # The broker closes the channel if the queue does not exist
+                channel = conn.channel()
+                try:
+                    _, num_tasks, num_consumers = queue(channel).queue_declare(passive=True)
+                except conn.channel_errors:
+                    num_tasks, num_consumers = 0, 0
+                finally:
+                    channel.close()
+                queue_status[queue.name] = {
+                    'tasks': num_tasks,
+                    'consumers': num_consumers,
+                }
+        return queue_status
+
+
+class CacheUtil(object):
+
+    DASHBOARD_CACHE = 'dashboard'
+
+    @staticmethod
+    def get_session_key(name, session, params=None):
+        # The key includes the session's last update so the cached data of a
+        # session is invalidated whenever a new result is uploaded
+        if params is None:
+            params = []
+        elif hasattr(params, 'lists'):  # QueryDict
+            params = sorted(params.lists())
+        else:
+            params = sorted(params.items())
+        digest = hashlib.sha1(json.dumps([name, params]).encode('utf-8')).hexdigest()
+        return 'session_{}_{}_{}'.format(
+            session.pk, session.last_update.strftime('%Y%m%d%H%M%S%f'), digest)
+
+    @staticmethod
+    def get_data_key(name, catalog_version, *data_ids):
+        # Knob/metric data never change once stored but which of them are
+        # featured depends on the catalogs, so the keys include the version
+        # of the catalogs (see Parser.CACHE_NAME)
+        return '{}_{}_{}'.format(name, catalog_version,
+                                 '_'.join(str(data_id) for data_id in data_ids))
+
+    @staticmethod
+    def get_or_set(key, compute_fn):
+        return caches[CacheUtil.DASHBOARD_CACHE].get_or_set(key, compute_fn)
+
+    @staticmethod
+    def clear():
+        caches[CacheUtil.DASHBOARD_CACHE].clear()
+
 
 class DataUtil(object):
 
     @staticmethod
     def aggregate_data(results):
-        knob_labels = list(JSONUtil.loads(results[0].knob_data.data).keys())
-        metric_labels = list(JSONUtil.loads(results[0].metric_data.data).keys())
-        X_matrix = np.empty((len(results), len(knob_labels)), dtype=float)
-        y_matrix = np.empty((len(results), len(metric_labels)), dtype=float)
-        rowlabels = np.empty(len(results), dtype=int)
-
-        for i, result in enumerate(results):
-            param_data = JSONUtil.loads(result.knob_data.data)
-            if len(param_data) != len(knob_labels):
-                raise Exception(
-                    ("Incorrect number of knobs "
-                     "(expected={}, actual={})").format(len(knob_labels),
-                                                        len(param_data)))
-            metric_data = JSONUtil.loads(result.metric_data.data)
-            if len(metric_data) != len(metric_labels):
-                raise Exception(
-                    ("Incorrect number of metrics "
-                     "(expected={}, actual={})").format(len(metric_labels),
-                                                        len(metric_data)))
-            X_matrix[i, :] = [param_data[l] for l in knob_labels]
-            y_matrix[i, :] = [metric_data[l] for l in metric_labels]
-            rowlabels[i] = result.pk
+        # Fetch the result ids and the cached knob/metric vectors with a
+        # single query over the joined tables (instead of lazily loading the
+        # knob_data and metric_data of each result) and stream the rows. The
+        # JSON payloads are only selected (and decoded row by row) for the
+        # data that has no vector.
+        num_results = results.count()
+        rows = results.annotate(
+            knob_json=DataUtil._json_without_vector('knob_data'),
+            metric_json=DataUtil._json_without_vector('metric_data'),
+        ).values_list('pk', 'knob_data__vector', 'knob_data__vector_schema', 'knob_json',
+                      'metric_data__vector', 'metric_data__vector_schema', 'metric_json')
+
+        knob_reader = _DataVectorReader('knobs')
+        metric_reader = _DataVectorReader('metrics')
+        X_matrix = y_matrix = rowlabels = None
+        num_rows = 0
+        for (result_id, knob_vector, knob_schema, knob_json,
+             metric_vector, metric_schema, metric_json) in rows.iterator():
+            if num_rows == num_results:
+                # Some results were added after we counted them
+                break
+            knob_values = knob_reader.read(knob_vector, knob_schema, knob_json)
+            metric_values = metric_reader.read(metric_vector, metric_schema, metric_json)
+            if num_rows == 0:
+                X_matrix = np.empty((num_results, len(knob_values)), dtype=float)
+                y_matrix = np.empty((num_results, len(metric_values)), dtype=float)
+                rowlabels = np.empty(num_results, dtype=int)
+            X_matrix[num_rows, :] = knob_values
+            y_matrix[num_rows, :] = metric_values
+            rowlabels[num_rows] = result_id
+            num_rows += 1
+
+        if num_rows == 0:
+            raise Exception("Cannot aggregate the data of an empty set of results")
+        if num_rows < num_results:
+            # Some results were deleted after we counted them
+            X_matrix = X_matrix[:num_rows]
+            y_matrix = y_matrix[:num_rows]
+            rowlabels = rowlabels[:num_rows]
         return {
             'X_matrix': X_matrix,
             'y_matrix': y_matrix,
             'rowlabels': rowlabels.tolist(),
-            'X_columnlabels': knob_labels,
-            'y_columnlabels': metric_labels,
+            'X_columnlabels': knob_reader.labels,
+            'y_columnlabels': metric_reader.labels,
+            'X_schema_id': knob_reader.schema_id,
+            'y_schema_id': metric_reader.schema_id,
         }
 
+    @staticmethod
+    def _json_without_vector(field_name):
+        return Case(When(**{field_name + '__vector__isnull': True,
+                            'then': F(field_name + '__data')}),
+                    default=Value(None), output_field=TextField())
+
     @staticmethod
     def combine_duplicate_rows(X_matrix, y_matrix, rowlabels):
-        X_unique, idxs, invs, cts = np.unique(X_matrix,
-                                              return_index=True,
-                                              return_inverse=True,
-                                              return_counts=True,
-                                              axis=0)
+        X_unique, invs, cts = np.unique(X_matrix,
+                                        return_inverse=True,
+                                        return_counts=True,
+                                        axis=0)
         num_unique = X_unique.shape[0]
         if num_unique == X_matrix.shape[0]:
             # No duplicate rows
@@ -139,18 +228,33 @@ class DataUtil(object):
             rowlabels = np.array([tuple([x]) for x in rowlabels])  # pylint: disable=bad-builtin,deprecated-lambda
             return X_matrix, y_matrix, rowlabels
 
-        # Combine duplicate rows
-        y_unique = np.empty((num_unique, y_matrix.shape[1]))
+        # Combine duplicate rows. A stable sort on the inverse indices groups
+        # the rows of each unique X row into one contiguous segment (in their
+        # original order), so the medians can be computed for all segments
+        # at once instead of masking the whole matrix once per unique row.
+        invs = np.asarray(invs).ravel()
+        order = np.argsort(invs, kind='mergesort')
+        seg_starts = np.concatenate(([0], np.cumsum(cts)[:-1]))
+        seg_ids = invs[order]
+
+        # Sort the y values within each segment (column-wise) and take the
+        # middle value(s) of each segment
+        y_sorted = np.asarray(y_matrix, dtype=float)[order].T
+        n_cols = y_sorted.shape[0]
+        within_order = np.lexsort((y_sorted, np.broadcast_to(seg_ids, y_sorted.shape)))
+        y_sorted = y_sorted[np.arange(n_cols)[:, np.newaxis], within_order]
+        lo_idxs = seg_starts + (cts - 1) // 2
+        hi_idxs = seg_starts + cts // 2
+        y_unique = ((y_sorted[:, lo_idxs] + y_sorted[:, hi_idxs]) / 2).T
+
+        # np.median returns NaN for any group containing a NaN
+        nan_groups = np.add.reduceat(np.isnan(y_sorted), seg_starts, axis=1).T > 0
+        y_unique[nan_groups] = np.nan
+
         rowlabels_unique = np.empty(num_unique, dtype=tuple)
-        ix = np.arange(X_matrix.shape[0])
-        for i, count in enumerate(cts):
-            if count == 1:
-                y_unique[i, :] = y_matrix[idxs[i], :]
-                rowlabels_unique[i] = (rowlabels[idxs[i]],)
-            else:
-                dup_idxs = ix[invs == i]
-                y_unique[i, :] = np.median(y_matrix[dup_idxs, :], axis=0)
-                rowlabels_unique[i] = tuple(rowlabels[dup_idxs])
+        for i, labels in enumerate(np.split(np.asarray(rowlabels)[order],
+                                            seg_starts[1:])):
+            rowlabels_unique[i] = tuple(labels)
         return X_unique, y_unique, rowlabels_unique
 
     @staticmethod
@@ -160,21 +264,15 @@ class DataUtil(object):
         cat_knob_names = []
         noncat_knob_names = []
         binary_knob_indices = []
-        dbms_info = DBMSCatalog.objects.filter(pk=dbms.pk)
-
-        if len(dbms_info) == 0:
-            raise Exception("DBMSCatalog cannot find dbms {}".format(dbms.full_name()))
-        full_dbms_name = dbms_info[0]
+        # knob can be uniquely identified by (dbms, knob_name)
+        knob_catalog = KnobCatalog.objects.get_metadata(dbms)
 
         for i, knob_name in enumerate(featured_knobs):
-            # knob can be uniquely identified by (dbms, knob_name)
-            knobs = KnobCatalog.objects.filter(name=knob_name,
-                                               dbms=dbms)
-            if len(knobs) == 0:
+            knob = knob_catalog.get(knob_name, None)
+            if knob is None:
                 raise Exception(
                     "KnobCatalog cannot find knob of name {} in {}".format(
-                        knob_name, full_dbms_name))
-            knob = knobs[0]
+                        knob_name, dbms.full_name))
             # check if knob is ENUM
             if knob.vartype == VarType.ENUM:
                 # enumvals is a comma delimited list
@@ -203,6 +301,48 @@ class DataUtil(object):
         return categorical_info
 
 
+class _DataVectorReader(object):
+    # Reads the values of KnobData/MetricData rows in the order of the labels
+    # of the first row, either from their vector or from their JSON data
+
+    def __init__(self, name):
+        self.name = name
+        self.labels = None
+        self.schema_id = None
+
+    def _check_labels(self, labels):
+        if self.labels is None:
+            self.labels = labels
+        elif len(labels) != len(self.labels):
+            raise Exception(
+                ("Incorrect number of {} "
+                 "(expected={}, actual={})").format(self.name, len(self.labels),
+                                                    len(labels)))
+        elif labels != self.labels:
+            raise Exception("The {} of the data do not match".format(self.name))
+
+    def read(self, vector, schema_id, data_json):
+        if vector is not None:
+            if schema_id != self.schema_id:
+                self._check_labels(LabelSchema.objects.get_labels(schema_id))
+                self.schema_id = schema_id
+            return np.frombuffer(vector, dtype=DataModel.VECTOR_DTYPE)
+
+        if self.labels is None:
+            # Use the first row to determine the (ordered) labels
+            data = JSONUtil.loads(data_json)
+            self._check_labels(list(data.keys()))
+            return list(data.values())
+        # The labels are already known so parse into a plain dict
+        data = json.loads(data_json)
+        if len(data) != len(self.labels):
+            raise Exception(
+                ("Incorrect number of {} "
+                 "(expected={}, actual={})").format(self.name, len(self.labels),
+                                                    len(data)))
+        return [data[label] for label in self.labels]
+
+
 class ConversionUtil(object):
 
     @staticmethod
@@ -4,37 +4,46 @@
 # Copyright (c) 2017-18, Carnegie Mellon University Database Group
 #
 import logging
-import datetime
-import re
+import os
+import time
+import zipfile
+import zlib
 from collections import OrderedDict
+from io import BytesIO
 
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth.forms import PasswordChangeForm
-from django.core.exceptions import ObjectDoesNotExist
-from django.http import HttpResponse, QueryDict
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseBadRequest, QueryDict
 from django.shortcuts import redirect, render, get_object_or_404
 from django.template.context_processors import csrf
 from django.template.defaultfilters import register
 from django.urls import reverse, reverse_lazy
-from django.utils.datetime_safe import datetime
 from django.utils.timezone import now
 from django.views.decorators.csrf import csrf_exempt
 from pytz import timezone
 
-from .forms import NewResultForm, ProjectForm, SessionForm
-from .models import (BackupData, DBMSCatalog, Hardware, KnobCatalog,
+from .forms import NewResultForm, NewResultsBatchForm, ProjectForm, SessionForm
+from .models import (BackupData, CacheVersion, DBMSCatalog, Hardware, KnobCatalog,
                      KnobData, MetricCatalog, MetricData, MetricManager,
-                     Project, Result, Session, Workload)
+                     Project, Result, ResultIngestion, Session, Workload)
 from .parser import Parser
-from .tasks import (aggregate_target_results, map_workload,
-                    configuration_recommendation)
+from .tasks import (aggregate_target_results, check_result_summary,
+                    configuration_recommendation, ingest_result, map_workload,
+                    parse_result_files, recommend_configuration, store_result_batch,
+                    store_result_files)
 from .types import (DBMSType, HardwareType, KnobUnitType, MetricType,
                     TaskType, VarType)
-from .utils import JSONUtil, LabelUtil, MediaUtil, TaskUtil
+from .utils import CacheUtil, JSONUtil, LabelUtil, MediaUtil, TaskUtil
 from .settings import TIME_ZONE
+from .settings import ASYNC_RESULT_INGESTION, RESULT_BATCH_SIZE  # pylint: disable=no-name-in-module
+from .settings import RESULT_WAIT_INTERVAL, RESULT_WAIT_TIMEOUT  # pylint: disable=no-name-in-module
+from .settings import SINGLE_TASK_RECOMMENDATION  # pylint: disable=no-name-in-module
+from .settings import TIMELINE_PAGE_SIZE  # pylint: disable=no-name-in-module
 
 LOG = logging.getLogger(__name__)
 
@@ -203,27 +212,8 @@ def session_view(request, project_id, session_id):
     # All results from this session
     results = Result.objects.filter(session=session)
 
-    # Group the session's results by DBMS & workload
-    dbmss = {}
-    workloads = {}
-    dbmss_ids = set()
-    workloads_ids = set()
-    for res in results:
-        if res.dbms_id not in dbmss_ids:
-            dbmss_ids.add(res.dbms_id)
-            res_dbms = res.dbms
-            dbmss[res_dbms.key] = res_dbms
-
-        if res.workload_id not in workloads_ids:
-            workloads_ids.add(res.workload_id)
-            res_workload = res.workload
-            workloads[res_workload.name] = set()
-            workloads[res_workload.name].add(res_workload)
-
-    # Sort so names will be ordered in the sidebar
-    workloads = OrderedDict([(k, sorted(list(v))) for
-                             k, v in sorted(workloads.items())])
-    dbmss = OrderedDict(sorted(dbmss.items()))
+    cache_key = CacheUtil.get_session_key('session_view', session)
+    dbmss, workloads = CacheUtil.get_or_set(cache_key, lambda: group_session_results(results))
 
     if len(workloads) > 0:
         # Set the default workload to whichever is first
@@ -261,6 +251,31 @@ def session_view(request, project_id, session_id):
     return render(request, 'session.html', context)
 
 
+def group_session_results(results):
+    # Group the session's results by DBMS & workload
+    dbmss = {}
+    workloads = {}
+    dbmss_ids = set()
+    workloads_ids = set()
+    for res in results:
+        if res.dbms_id not in dbmss_ids:
+            dbmss_ids.add(res.dbms_id)
+            res_dbms = res.dbms
+            dbmss[res_dbms.key] = res_dbms
+
+        if res.workload_id not in workloads_ids:
+            workloads_ids.add(res.workload_id)
+            res_workload = res.workload
+            workloads[res_workload.name] = set()
+            workloads[res_workload.name].add(res_workload)
+
+    # Sort so names will be ordered in the sidebar
+    workloads = OrderedDict([(k, sorted(list(v))) for
+                             k, v in sorted(workloads.items())])
+    dbmss = OrderedDict(sorted(dbmss.items()))
+    return dbmss, workloads
+
+
 @login_required(login_url=reverse_lazy('login'))
 def create_or_edit_session(request, project_id, session_id=''):
     project = get_object_or_404(Project, pk=project_id, user=request.user)
@@ -383,112 +398,157 @@ def new_result(request):
     return HttpResponse("Request type was not POST")
 
 
-def handle_result_files(session, files):
+@csrf_exempt
+def new_results_batch(request):
+    if request.method == 'POST':
+        form = NewResultsBatchForm(request.POST, request.FILES)
+
+        if not form.is_valid():
+            LOG.warning("New results batch form is not valid: %s", str(form.errors))
+            return HttpResponse("New results batch form is not valid: " + str(form.errors))
+        upload_code = form.cleaned_data['upload_code']
+        try:
+            session = Session.objects.get(upload_code=upload_code)
+        except Session.DoesNotExist:
+            LOG.warning("Invalid upload code: %s", upload_code)
+            return HttpResponse("Invalid upload code: " + upload_code)
+
+        return handle_result_batch(session, request.FILES['archive'],
+                                   form.cleaned_data['recommend'])
+    LOG.warning("Request type was not POST")
+    return HttpResponse("Request type was not POST")
+
+
+def get_tuner_tasks():
+    # Returns the tasks that recommend the next configuration to try for a
+    # result (whose id is passed to the first task) and the ids of the tasks
+    # whose status is reported for the result, one for each TaskType. Their
+    # ids are assigned up front so they can be saved before the tasks start.
+    from celery.utils import uuid
+    if SINGLE_TASK_RECOMMENDATION:
+        task_ids = [uuid() for _ in TaskType.TYPE_NAMES]
+        return [recommend_configuration.s(stage_task_ids=task_ids)], task_ids
+    tasks = [aggregate_target_results.s(),
+             map_workload.s(),
+             configuration_recommendation.s()]
+    for t in tasks:
+        t.set(task_id=uuid())
+    return tasks, [t.id for t in tasks]
+
+
+def run_tuner_tasks(result):
     from celery import chain
-    # Combine into contiguous files
-    files = {k: b''.join(v.chunks()).decode() for k, v in list(files.items())}
+    tasks, task_ids = get_tuner_tasks()
+    result.task_ids = ','.join(task_ids)
+    result.save()
+    return chain(*tasks).apply_async((result.pk,))
 
-    # Load the contents of the controller's summary file
-    summary = JSONUtil.loads(files['summary'])
-    dbms_type = DBMSType.type(summary['database_type'])
-    dbms_version = summary['database_version']  # TODO: fix parse_version_string
-    workload_name = summary['workload_name']
-    observation_time = summary['observation_time']
-    start_time = datetime.fromtimestamp(
-        # int(summary['start_time']), # unit: seconds
-        int(summary['start_time']) / 1000,  # unit: ms
-        timezone(TIME_ZONE))
-    end_time = datetime.fromtimestamp(
-        # int(summary['end_time']), # unit: seconds
-        int(summary['end_time']) / 1000,  # unit: ms
-        timezone(TIME_ZONE))
-
-    # Check if workload name only contains alpha-numeric, underscore and hyphen
-    if not re.match('^[a-zA-Z0-9_-]+$', workload_name):
-        return HttpResponse('Your workload name ' + workload_name + ' contains '
-                            'invalid characters! It should only contain '
-                            'alpha-numeric, underscore(_) and hyphen(-)')
 
+def handle_result_batch(session, archive_file, recommend):
     try:
-        # Check that we support this DBMS and version
-        dbms = DBMSCatalog.objects.get(
-            type=dbms_type, version=dbms_version)
-    except ObjectDoesNotExist:
-        return HttpResponse('{} v{} is not yet supported.'.format(
-            dbms_type, dbms_version))
-
-    if dbms != session.dbms:
-        return HttpResponse('The DBMS must match the type and version '
-                            'specified when creating the session. '
-                            '(expected=' + session.dbms.full_name + ') '
-                            '(actual=' + dbms.full_name + ')')
-
-    # Load, process, and store the knobs in the DBMS's configuration
-    knob_dict, knob_diffs = Parser.parse_dbms_knobs(
-        dbms.pk, JSONUtil.loads(files['knobs']))
-    tunable_knob_dict = Parser.convert_dbms_knobs(
-        dbms.pk, knob_dict)
-    knob_data = KnobData.objects.create_knob_data(
-        session, JSONUtil.dumps(knob_dict, pprint=True, sort=True),
-        JSONUtil.dumps(tunable_knob_dict, pprint=True, sort=True), dbms)
-
-    # Load, process, and store the runtime metrics exposed by the DBMS
-    initial_metric_dict, initial_metric_diffs = Parser.parse_dbms_metrics(
-        dbms.pk, JSONUtil.loads(files['metrics_before']))
-    final_metric_dict, final_metric_diffs = Parser.parse_dbms_metrics(
-        dbms.pk, JSONUtil.loads(files['metrics_after']))
-    metric_dict = Parser.calculate_change_in_metrics(
-        dbms.pk, initial_metric_dict, final_metric_dict)
-    initial_metric_diffs.extend(final_metric_diffs)
-    numeric_metric_dict = Parser.convert_dbms_metrics(
-        dbms.pk, metric_dict, observation_time, session.target_objective)
-    metric_data = MetricData.objects.create_metric_data(
-        session, JSONUtil.dumps(metric_dict, pprint=True, sort=True),
-        JSONUtil.dumps(numeric_metric_dict, pprint=True, sort=True), dbms)
-
-    # Create a new workload if this one does not already exist
-    workload = Workload.objects.create_workload(
-        dbms, session.hardware, workload_name)
-
-    # Save this result
-    result = Result.objects.create_result(
-        session, dbms, workload, knob_data, metric_data,
-        start_time, end_time, observation_time)
-    result.save()
+        archive = zipfile.ZipFile(archive_file)
+    except zipfile.BadZipfile:
+        return HttpResponse("The results archive is not a valid zip file")
+
+    # Group the files of each result by their prefix
+    samples = OrderedDict()
+    for member in sorted(archive.namelist()):
+        prefix, _, filename = os.path.basename(member).rpartition('__')
+        name, ext = os.path.splitext(filename)
+        if prefix and ext == '.json' and name in BackupData.RAW_FIELDS:
+            samples.setdefault(prefix, {})[name] = member
+    for prefix in [p for p, members in samples.items()
+                   if len(members) != len(BackupData.RAW_FIELDS)]:
+        LOG.warning("Skipping incomplete result %s in the results archive", prefix)
+        del samples[prefix]
+    if len(samples) == 0:
+        return HttpResponse("The results archive does not contain any results")
+
+    # Check all the summaries before storing anything
+    summaries = {}
+    for prefix, members in samples.items():
+        summary = JSONUtil.loads(archive.read(members['summary']).decode('utf-8'))
+        dbms, error = check_result_summary(session, summary)
+        if error is not None:
+            return HttpResponse('{}: {}'.format(prefix, error))
+        summaries[prefix] = summary
+
+    # Parse and store the results in batches, all in a single transaction
+    prefixes = list(samples.keys())
+    results = []
+    with transaction.atomic():
+        for i in range(0, len(prefixes), RESULT_BATCH_SIZE):
+            parsed_results = []
+            for prefix in prefixes[i:i + RESULT_BATCH_SIZE]:
+                contents = {name: archive.read(member)
+                            for name, member in samples[prefix].items()}
+                files = {name: BytesIO(content) for name, content in contents.items()}
+                parsed = parse_result_files(session, dbms, summaries[prefix], files)
+                parsed['raw_files'] = {name: zlib.compress(content)
+                                       for name, content in contents.items()}
+                parsed_results.append(parsed)
+            results.extend(store_result_batch(session, dbms, parsed_results))
+
+    if not recommend or session.tuning_session == 'no_tuning_session':
+        return HttpResponse("{} results stored successfully!".format(len(results)))
+
+    # Only recommend a configuration for the latest result
+    result = max(results, key=lambda r: r.observation_end_time)
+    response = run_tuner_tasks(result)
+    return HttpResponse("{} results stored successfully! Running tuner...(status={})  "
+                        "Result ID:{} ".format(len(results), response.status, result.pk))
+
 
-    # Save all original data
-    backup_data = BackupData.objects.create(
-        result=result, raw_knobs=files['knobs'],
-        raw_initial_metrics=files['metrics_before'],
-        raw_final_metrics=files['metrics_after'],
-        raw_summary=files['summary'],
-        knob_log=knob_diffs,
-        metric_log=initial_metric_diffs)
-    backup_data.save()
-
-    nondefault_settings = Parser.get_nondefault_knob_settings(
-        dbms.pk, knob_dict)
-    session.project.last_update = now()
-    session.last_update = now()
-    if session.nondefault_settings is None:
-        session.nondefault_settings = JSONUtil.dumps(nondefault_settings)
-    session.project.save()
-    session.save()
+def handle_result_files(session, files):
+    # The uploaded files are streamed to temporary files (see
+    # FILE_UPLOAD_HANDLERS) and are decoded directly from them
+    if ASYNC_RESULT_INGESTION:
+        return handle_result_ingestion(session, files)
+
+    # Load the contents of the controller's summary file
+    summary = JSONUtil.load(files['summary'])
+    dbms, error = check_result_summary(session, summary)
+    if error is not None:
+        return HttpResponse(error)
+
+    result = store_result_files(session, dbms, summary, files,
+                                BackupData.objects.compress_files(files))
 
     if session.tuning_session == 'no_tuning_session':
         return HttpResponse("Result stored successfully!")
 
     result_id = result.pk
-    response = chain(aggregate_target_results.s(result.pk),
-                     map_workload.s(),
-                     configuration_recommendation.s()).apply_async()
-    taskmeta_ids = [response.parent.parent.id, response.parent.id, response.id]
-    result.task_ids = ','.join(taskmeta_ids)
-    result.save()
+    response = run_tuner_tasks(result)
     return HttpResponse("Result stored successfully! Running tuner...(status={})  Result ID:{} "
                         .format(response.status, result_id))
 
 
+def handle_result_ingestion(session, files):
+    from celery import chain
+    from celery.utils import uuid
+    # Only save the raw files here. They are parsed and stored by the first
+    # task of the chain so that the web workers are not kept busy.
+    raw_files = BackupData.objects.compress_files(files)
+    ingestion = ResultIngestion.objects.create(
+        session=session, creation_time=now(),
+        **{field: raw_files[name] for name, field in BackupData.RAW_FIELDS.items()})
+
+    ingest_task = ingest_result.si(ingestion.pk).set(task_id=uuid())
+    tasks, task_ids = [ingest_task], [ingest_task.id]
+    if session.tuning_session != 'no_tuning_session':
+        tuner_tasks, tuner_task_ids = get_tuner_tasks()
+        tasks.extend(tuner_tasks)
+        task_ids.extend(tuner_task_ids)
+    # The task ids are assigned up front so they are saved before the chain
+    # starts
+    ingestion.task_ids = ','.join(task_ids)
+    ingestion.save()
+
+    response = chain(*tasks).apply_async()
+    return HttpResponse("Result received! Storing result...(status={})  Ingestion ID:{} "
+                        .format(response.status, ingestion.pk))
+
+
 @login_required(login_url=reverse_lazy('login'))
 def dbms_knobs_reference(request, dbms_name, version, knob_name):
     knob = get_object_or_404(KnobCatalog, dbms__type=DBMSType.type(dbms_name),
@@ -547,7 +607,7 @@ def dbms_metrics_reference(request, dbms_name, version, metric_name):
 
 @login_required(login_url=reverse_lazy('login'))
 def knob_data_view(request, project_id, session_id, data_id):  # pylint: disable=unused-argument
-    knob_data = get_object_or_404(KnobData, pk=data_id)
+    knob_data = get_object_or_404(KnobData.objects.defer('knobs', 'data', 'vector'), pk=data_id)
     labels = KnobData.get_labels()
     labels.update(LabelUtil.style_labels({
         'featured_data': 'tunable dbms parameters',
@@ -563,7 +623,8 @@ def knob_data_view(request, project_id, session_id, data_id):  # pylint: disable
 
 @login_required(login_url=reverse_lazy('login'))
 def metric_data_view(request, project_id, session_id, data_id):  # pylint: disable=unused-argument
-    metric_data = get_object_or_404(MetricData, pk=data_id)
+    metric_data = get_object_or_404(MetricData.objects.defer('metrics', 'data', 'vector'),
+                                    pk=data_id)
     labels = MetricData.get_labels()
     labels.update(LabelUtil.style_labels({
         'featured_data': 'numeric dbms metrics',
@@ -581,34 +642,30 @@ def dbms_data_view(request, context, dbms_data):
     if context['data_type'] == 'knobs':
         model_class = KnobData
         filter_fn = Parser.filter_tunable_knobs
-        obj_data = dbms_data.knobs
+        data_field = 'knobs'
     else:
         model_class = MetricData
         filter_fn = Parser.filter_numeric_metrics
-        obj_data = dbms_data.metrics
-
-    dbms_id = dbms_data.dbms.pk
-    all_data_dict = JSONUtil.loads(obj_data)
-    featured_dict = filter_fn(dbms_id, all_data_dict)
+        data_field = 'metrics'
 
     if 'compare' in request.GET and request.GET['compare'] != 'none':
         comp_id = request.GET['compare']
-        compare_obj = model_class.objects.get(pk=comp_id)
-        comp_data = compare_obj.knobs if \
-            context['data_type'] == 'knobs' else compare_obj.metrics
-        comp_dict = JSONUtil.loads(comp_data)
-        comp_featured_dict = filter_fn(dbms_id, comp_dict)
-
-        all_data = [(k, v, comp_dict[k]) for k, v in list(all_data_dict.items())]
-        featured_data = [(k, v, comp_featured_dict[k])
-                         for k, v in list(featured_dict.items())]
     else:
         comp_id = None
-        all_data = list(all_data_dict.items())
-        featured_data = list(featured_dict.items())
+
+    # The lists (and their differences) are computed once per pair of data
+    # rows (and version of the catalogs) and then cached so the JSON payloads
+    # are only loaded once
+    catalog_version = CacheVersion.objects.get_checked_version(Parser.CACHE_NAME)
+    cache_key = CacheUtil.get_data_key(context['data_type'], catalog_version,
+                                       dbms_data.pk, comp_id)
+    all_data, featured_data = CacheUtil.get_or_set(cache_key, lambda: get_dbms_data_lists(
+        model_class, data_field, filter_fn, dbms_data, comp_id))
+
+    # The peers are only listed so their large fields are not loaded
     peer_data = model_class.objects.filter(
-        dbms=dbms_data.dbms, session=dbms_data.session)
-    peer_data = [peer for peer in peer_data if peer.pk != dbms_data.pk]
+        dbms=dbms_data.dbms, session=dbms_data.session).exclude(
+            pk=dbms_data.pk).only('pk', 'name')
 
     context['all_data'] = all_data
     context['featured_data'] = featured_data
@@ -618,22 +675,34 @@ def dbms_data_view(request, context, dbms_data):
     return render(request, 'dbms_data.html', context)
 
 
+def get_dbms_data_lists(model_class, data_field, filter_fn, dbms_data, comp_id):
+    # Returns the (name, value) rows of all data and of the featured data.
+    # When comparing, the rows are (name, value, comparing value, changed).
+    data_values = model_class.objects.values_list(data_field, flat=True)
+    all_data_dict = JSONUtil.loads(data_values.get(pk=dbms_data.pk))
+    featured_names = filter_fn(dbms_data.dbms_id, all_data_dict).keys()
+
+    if comp_id is None:
+        all_data = list(all_data_dict.items())
+        featured_data = [(k, all_data_dict[k]) for k in featured_names]
+    else:
+        comp_dict = JSONUtil.loads(get_object_or_404(data_values, pk=comp_id))
+        all_rows = OrderedDict()
+        for k, v in all_data_dict.items():
+            comp_v = comp_dict.get(k, None)
+            all_rows[k] = (k, v, comp_v, k in comp_dict and comp_v != v)
+        all_data = list(all_rows.values())
+        featured_data = [all_rows[k] for k in featured_names]
+    return all_data, featured_data
+
+
 @login_required(login_url=reverse_lazy('login'))
 def workload_view(request, project_id, session_id, wkld_id):  # pylint: disable=unused-argument
     workload = get_object_or_404(Workload, pk=wkld_id)
     session = get_object_or_404(Session, pk=session_id)
 
-    knob_confs = KnobData.objects.filter(dbms=session.dbms,
-                                         session=session)
-    knob_conf_map = {}
-    for conf in knob_confs:
-        latest_result = Result.objects.filter(
-            session=session, knob_data=conf, workload=workload).order_by(
-                '-observation_end_time').first()
-        if not latest_result:
-            continue
-        knob_conf_map[conf.name] = [conf, latest_result]
-    knob_conf_map = OrderedDict(sorted(list(knob_conf_map.items()), key=lambda x: x[1][0].pk))
+    cache_key = CacheUtil.get_session_key('workload_view', session, {'workload': workload.pk})
+    knob_conf_map = CacheUtil.get_or_set(cache_key, lambda: get_knob_conf_map(session, workload))
     default_knob_confs = [c for c, _ in list(knob_conf_map.values())][:5]
     LOG.debug("default_knob_confs: %s", default_knob_confs)
 
@@ -652,6 +721,26 @@ def workload_view(request, project_id, session_id, wkld_id):  # pylint: disable=
     return render(request, 'workload.html', context)
 
 
+def get_knob_conf_map(session, workload):
+    # Maps the name of each knob configuration of the session to the
+    # configuration and its latest result on the workload. The results of
+    # all configurations are read by a single query ordered by configuration
+    # and time, so the first result of each configuration is its latest one.
+    results = Result.objects.filter(
+        session=session, workload=workload, knob_data__session=session,
+        knob_data__dbms=session.dbms)\
+        .select_related('knob_data')\
+        .defer('next_configuration', 'knob_data__knobs', 'knob_data__data',
+               'knob_data__vector')\
+        .order_by('knob_data', '-observation_end_time')
+    knob_conf_map = {}
+    for latest_result in results.iterator():
+        conf = latest_result.knob_data
+        if conf.name not in knob_conf_map:
+            knob_conf_map[conf.name] = [conf, latest_result]
+    return OrderedDict(sorted(list(knob_conf_map.items()), key=lambda x: x[1][0].pk))
+
+
 @login_required(login_url=reverse_lazy('login'))
 def download_next_config(request):
     data = request.GET
@@ -670,7 +759,9 @@ def tuner_status_view(request, project_id, session_id, result_id):  # pylint: di
     tasks = TaskUtil.get_tasks(res.task_ids)
 
     overall_status, num_completed = TaskUtil.get_task_status(tasks)
-    if overall_status in ['PENDING', 'RECEIVED', 'STARTED']:
+    # The tasks skipped for a newer result (see skip_superseded_tasks) may
+    # not have started at all
+    if overall_status in [None, 'PENDING', 'RECEIVED', 'STARTED']:
         completion_time = 'N/A'
         total_runtime = 'N/A'
     else:
@@ -708,47 +799,65 @@ def get_workload_data(request):
     if session.user != request.user:
         return render(request, '404.html')
 
-    results = Result.objects.filter(workload=workload)
-    result_data = {r.pk: JSONUtil.loads(r.metric_data.data) for r in results}
-    results = sorted(results, key=lambda x: int(result_data[x.pk][MetricManager.THROUGHPUT]))
+    cache_key = CacheUtil.get_session_key('workload_data', session, request.GET)
+    response_data = CacheUtil.get_or_set(cache_key, lambda: JSONUtil.dumps(
+        workload_data_package(session, workload, request.GET)))
+    return HttpResponse(response_data, content_type='application/json')
+
 
+def workload_data_package(session, workload, params):
     default_metrics = MetricCatalog.objects.get_default_metrics(session.target_objective)
-    metrics = request.GET.get('met', ','.join(default_metrics)).split(',')
+    metrics = params.get('met', ','.join(default_metrics)).split(',')
     metrics = [m for m in metrics if m != 'none']
     if len(metrics) == 0:
         metrics = default_metrics
 
+    # Fetch the results of the selected configurations with their knob and
+    # metric data in one query, then read the throughput and the selected
+    # metrics of each result once
+    knob_confs = params['conf'].split(',')
+    results = list(Result.objects.filter(
+        workload=workload, knob_data__pk__in=[c for c in knob_confs if c.isdigit()])
+        .select_related('knob_data', 'metric_data').order_by('pk')
+        .defer('next_configuration', 'knob_data__knobs', 'knob_data__data',
+               'knob_data__vector', 'metric_data__metrics', 'metric_data__data'))
+    metric_values = MetricData.objects.get_selected_values(
+        [r.metric_data for r in results], [MetricManager.THROUGHPUT] + metrics)
+    results = sorted(results, key=lambda x: int(metric_values[x.metric_data.pk][0]))
+
     data_package = {'results': [],
                     'error': 'None',
                     'metrics': metrics}
     metric_meta = MetricCatalog.objects.get_metric_meta(session.dbms, session.target_objective)
-    for met in data_package['metrics']:
-        met_info = metric_meta[met]
+    met_infos = [metric_meta[met] for met in metrics]
+    for met_info in met_infos:
         data_package['results'].append({'data': [[]], 'tick': [],
                                         'unit': met_info.unit,
                                         'lessisbetter': met_info.improvement,
                                         'metric': met_info.pprint})
 
-        added = set()
-        knob_confs = data['conf'].split(',')
-        i = len(knob_confs)
-        for r in results:
-            metric_data = JSONUtil.loads(r.metric_data.data)
-            if r.knob_data.pk in added or str(r.knob_data.pk) not in knob_confs:
-                continue
-            added.add(r.knob_data.pk)
-            data_val = metric_data[met] * met_info.scale
-            data_package['results'][-1]['data'][0].append([
+    # Build the series of all metrics in a single pass over the results
+    added = set()
+    i = len(knob_confs)
+    for r in results:
+        if r.knob_data.pk in added:
+            continue
+        added.add(r.knob_data.pk)
+        values = metric_values[r.metric_data.pk][1:]
+        for series, met_info, value in zip(data_package['results'], met_infos, values):
+            data_val = value * met_info.scale
+            series['data'][0].append([
                 i,
                 data_val,
                 r.pk,
                 data_val])
-            data_package['results'][-1]['tick'].append(r.knob_data.name)
-            i -= 1
-        data_package['results'][-1]['data'].reverse()
-        data_package['results'][-1]['tick'].reverse()
+            series['tick'].append(r.knob_data.name)
+        i -= 1
+    for series in data_package['results']:
+        series['data'].reverse()
+        series['tick'].reverse()
 
-    return HttpResponse(JSONUtil.dumps(data_package), content_type='application/json')
+    return data_package
 
 
 # Data Format:
@@ -773,51 +882,106 @@ def get_timeline_data(request):
         'error': 'None',
         'timelines': [],
         'columnnames': columnnames,
+        'next_cursor': None,
     }
 
     session = get_object_or_404(Session, pk=request.GET['session'])
     if session.user != request.user:
         return HttpResponse(JSONUtil.dumps(data_package), content_type='application/json')
 
+    # The results table is loaded one page (of at most TIMELINE_PAGE_SIZE
+    # results) at a time. The cursor is the id of the result the previous
+    # page ended with.
+    try:
+        page_size = int(request.GET.get('limit', TIMELINE_PAGE_SIZE))
+        cursor = request.GET.get('cursor') or None
+        if cursor is not None:
+            cursor = int(cursor)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid limit or cursor")
+    page_size = min(max(page_size, 1), TIMELINE_PAGE_SIZE)
+
+    cache_key = CacheUtil.get_session_key('timeline_data', session, request.GET)
+    response_data = CacheUtil.get_or_set(cache_key, lambda: JSONUtil.dumps(
+        timeline_data_package(session, request.GET, page_size, cursor, data_package)))
+    return HttpResponse(response_data, content_type='application/json')
+
+
+def timeline_data_package(session, params, page_size, cursor, data_package):
     default_metrics = MetricCatalog.objects.get_default_metrics(session.target_objective)
 
     metric_meta = MetricCatalog.objects.get_metric_meta(session.dbms, session.target_objective)
     for met in default_metrics:
         met_info = metric_meta[met]
-        columnnames.append(met_info.pprint + ' (' + met_info.short_unit + ')')
+        data_package['columnnames'].append(met_info.pprint + ' (' + met_info.short_unit + ')')
 
-    results_per_page = int(request.GET['nres'])
+    results_per_page = int(params['nres'])
 
-    # Get all results related to the selected session, sort by time
+    # The results are filtered and ordered by the database and only their
+    # numeric metric vectors are loaded (not the JSON data)
     results = Result.objects.filter(session=session)\
-        .select_related('knob_data', 'metric_data', 'workload')
-    results = sorted(results, key=lambda x: x.observation_end_time)
+        .select_related('knob_data', 'metric_data', 'workload', 'dbms')\
+        .defer('next_configuration', 'knob_data__knobs', 'knob_data__data',
+               'knob_data__vector', 'metric_data__metrics', 'metric_data__data')
 
-    display_type = request.GET['wkld']
+    display_type = params['wkld']
     if display_type == 'show_none':
         workloads = []
         metrics = default_metrics
-        results = []
+        page = []
     else:
-        metrics = request.GET.get('met', ','.join(default_metrics)).split(',')
+        metrics = params.get('met', ','.join(default_metrics)).split(',')
         metrics = [m for m in metrics if m != 'none']
         if len(metrics) == 0:
             metrics = default_metrics
         workloads = [display_type]
-        workload_confs = [wc for wc in request.GET['spe'].strip().split(',') if wc != '']
-        results = [r for r in results if str(r.workload.pk) in workload_confs]
+        workload_confs = [wc for wc in params['spe'].strip().split(',') if wc != '']
+        results = results.filter(workload__pk__in=workload_confs)
+
+        # The table lists a page of the latest results. The cursor is the
+        # (oldest) result the previous page ended with.
+        page = results.order_by('-observation_end_time', '-pk')
+        if cursor is not None:
+            cursor_result = get_object_or_404(Result, pk=cursor, session=session)
+            page = page.filter(
+                Q(observation_end_time__lt=cursor_result.observation_end_time) |
+                Q(observation_end_time=cursor_result.observation_end_time,
+                  pk__lt=cursor_result.pk))
+        page = list(page[:page_size + 1])
+        if len(page) > page_size:
+            page = page[:page_size]
+            data_package['next_cursor'] = page[-1].pk
+        page.reverse()
+
+    # For plotting charts, the latest results of each dbms. The charts are
+    # only sent with the first page of results.
+    dbms_keys = {dbms.key: dbms.pk for dbms in DBMSCatalog.objects.all()}
+    timeline_results = []
+    for wkld in (workloads if cursor is None else []):
+        for dbms in params['dbms'].split(','):
+            if dbms not in dbms_keys:
+                continue
+            d_r = list(results.filter(workload__name=wkld, dbms=dbms_keys[dbms])
+                       .order_by('-observation_end_time', '-pk')[:results_per_page])
+            d_r.reverse()
+            timeline_results.append((wkld, dbms, d_r))
+
+    metric_datas = {}
+    for res in page + [r for _, _, d_r in timeline_results for r in d_r]:
+        metric_datas[res.metric_data.pk] = res.metric_data
+    metric_values = MetricData.objects.get_selected_values(list(metric_datas.values()), metrics)
+    metric_scales = [metric_meta[met].scale for met in metrics]
 
-    metric_datas = {r.pk: JSONUtil.loads(r.metric_data.data) for r in results}
     result_list = []
-    for res in results:
+    for res in page:
         entry = [
             res.pk,
             res.observation_end_time.astimezone(timezone(TIME_ZONE)).strftime("%Y-%m-%d %H:%M:%S"),
             res.knob_data.name,
             res.metric_data.name,
             res.workload.name]
-        for met in metrics:
-            entry.append(metric_datas[res.pk][met] * metric_meta[met].scale)
+        entry.extend(value * scale for value, scale in
+                     zip(metric_values[res.metric_data.pk], metric_scales))
         entry.extend([
             '',
             res.knob_data.pk,
@@ -827,14 +991,9 @@ def get_timeline_data(request):
         result_list.append(entry)
     data_package['results'] = result_list
 
-    # For plotting charts
-    for metric in metrics:
+    for i, metric in enumerate(metrics):
         met_info = metric_meta[metric]
         for wkld in workloads:
-            w_r = [r for r in results if r.workload.name == wkld]
-            if len(w_r) == 0:
-                continue
-
             data = {
                 'workload': wkld,
                 'units': met_info.unit,
@@ -845,47 +1004,82 @@ def get_timeline_data(request):
                 'print_metric': met_info.pprint,
             }
 
-            for dbms in request.GET['dbms'].split(','):
-                d_r = [r for r in w_r if r.dbms.key == dbms]
-                d_r = d_r[-results_per_page:]
-                out = []
-                for res in d_r:
-                    metric_data = JSONUtil.loads(res.metric_data.data)
-                    out.append([
-                        res.observation_end_time.astimezone(timezone(TIME_ZONE)).
-                        strftime("%m-%d-%y %H:%M"),
-                        metric_data[metric] * met_info.scale,
-                        "",
-                        str(res.pk)
-                    ])
-
-                if len(out) > 0:
-                    data['data'][dbms] = out
-
-            data_package['timelines'].append(data)
-
-    return HttpResponse(JSONUtil.dumps(data_package), content_type='application/json')
+            for w_name, dbms, d_r in timeline_results:
+                if w_name != wkld or len(d_r) == 0:
+                    continue
+                data['data'][dbms] = [[
+                    res.observation_end_time.astimezone(timezone(TIME_ZONE)).
+                    strftime("%m-%d-%y %H:%M"),
+                    metric_values[res.metric_data.pk][i] * met_info.scale,
+                    "",
+                    str(res.pk)
+                ] for res in d_r]
+
+            if len(data['data']) > 0:
+                data_package['timelines'].append(data)
+
+    return data_package
+
+
+def get_latest_upload_status(session):
+    # Returns the latest result of the session, the status of its tasks and
+    # whether they are done. While the files of the latest upload are not
+    # stored yet (see ASYNC_RESULT_INGESTION), the status is the one of their
+    # ingestion instead.
+    ingestion = ResultIngestion.objects.get_pending(session)
+    if ingestion is not None:
+        ingest_tasks = TaskUtil.get_tasks(ingestion.task_ids.split(',')[0])
+        status, _ = TaskUtil.get_task_status(ingest_tasks)
+        if status in ['FAILURE', 'REVOKED', 'RETRY']:
+            return None, status, True
+        return None, 'PENDING', False
+
+    lastest_result = Result.objects.get_latest(session)
+    if lastest_result is None:
+        return None, None, True
+    num_tasks = len(lastest_result.task_ids.split(',')) if lastest_result.task_ids else 0
+    tasks = TaskUtil.get_tasks(lastest_result.task_ids)
+    overall_status, num_completed = TaskUtil.get_task_status(tasks)
+    done = overall_status in ['FAILURE', 'REVOKED', 'RETRY'] or num_completed == num_tasks
+    return lastest_result, overall_status, done
 
 
-# get the lastest result
+# get the lastest result. With a wait parameter (in seconds), the request
+# blocks until the tuning tasks of the result complete (or the wait expires)
+# instead of the client polling repeatedly.
 def give_result(request, upload_code):  # pylint: disable=unused-argument
     try:
         session = Session.objects.get(upload_code=upload_code)
     except Session.DoesNotExist:
         LOG.warning("Invalid upload code: %s", upload_code)
         return HttpResponse("Invalid upload code: " + upload_code)
-    results = Result.objects.filter(session=session)
-    lastest_result = results[len(results) - 1]
 
-    tasks = TaskUtil.get_tasks(lastest_result.task_ids)
-    overall_status, _ = TaskUtil.get_task_status(tasks)
+    try:
+        wait = min(float(request.GET.get('wait', 0)), RESULT_WAIT_TIMEOUT)
+    except ValueError:
+        return HttpResponse("Invalid wait time: " + request.GET['wait'])
+    deadline = time.time() + wait
+    while True:
+        lastest_result, overall_status, done = get_latest_upload_status(session)
+        if done or time.time() + RESULT_WAIT_INTERVAL > deadline:
+            break
+        time.sleep(RESULT_WAIT_INTERVAL)
+        # A pending ingestion may have stored a newer result in the meantime
+        session.refresh_from_db(fields=['latest_result'])
 
-    if overall_status in ['PENDING', 'RECEIVED', 'STARTED']:
-        return HttpResponse("Result not ready")
     # unclear behaviors for REVOKED and RETRY, treat as failure
-    elif overall_status in ['FAILURE', 'REVOKED', 'RETRY']:
+    if overall_status in ['FAILURE', 'REVOKED', 'RETRY']:
         return HttpResponse("Fail")
+    elif not done or lastest_result is None:
+        return HttpResponse("Result not ready")
 
     # success
     res = Result.objects.get(pk=lastest_result.pk)
     return HttpResponse(JSONUtil.dumps(res.next_configuration), content_type='application/json')
+
+
+# Number of queued tasks and of workers of each celery queue, for monitoring
+@login_required(login_url=reverse_lazy('login'))
+def queue_status(request):  # pylint: disable=unused-argument
+    return HttpResponse(JSONUtil.dumps(TaskUtil.get_queue_status(), pprint=True),
+                        content_type='application/json')